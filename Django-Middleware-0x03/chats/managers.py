@@ -0,0 +1,29 @@
+from django.db import models
+from django.db.models import F, OuterRef, Prefetch, Subquery
+
+
+class ConversationQuerySet(models.QuerySet):
+    participant_fields = ("user_id", "username", "first_name", "last_name")
+
+    def with_inbox_summary(self):
+        """
+        Annotate each conversation with its latest message and prefetch a
+        slim participant list, so a page of the inbox costs two queries
+        however many conversations or participants it holds. Newest
+        activity first.
+        """
+        message_model = self.model._meta.get_field("messages").related_model
+        user_model = self.model._meta.get_field("participants").related_model
+        latest = message_model.objects.filter(conversation=OuterRef("pk")).order_by("-sent_at", "-message_id")
+        return (
+            self.annotate(
+                last_message_id=Subquery(latest.values("message_id")[:1]),
+                last_message_body=Subquery(latest.values("message_body")[:1]),
+                last_message_sender_id=Subquery(latest.values("sender_id")[:1]),
+                last_message_at=Subquery(latest.values("sent_at")[:1]),
+            )
+            .prefetch_related(
+                Prefetch("participants", queryset=user_model.objects.only(*self.participant_fields))
+            )
+            .order_by(F("last_message_at").desc(nulls_last=True), "-created_at")
+        )
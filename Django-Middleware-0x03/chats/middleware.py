@@ -1,81 +1,158 @@
-import logging
 import time
 from datetime import datetime
-from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpResponseForbidden
 
-from django.utils.deprecation import MiddlewareMixin
-class RequestLoggingMiddleware:
+from .ratelimit import build_limiter, get_rate_limit_config
+from .request_log import get_request_logger
+
+
+class HybridMiddleware:
+    """
+    Base for middleware that runs natively under both WSGI and ASGI, so
+    Django never has to wrap it in a thread hop.
+
+    Subclasses implement ``check(request, user)``, returning a response to
+    stop the request early, and/or ``finish(request, user, response)``.
+    The user is resolved with ``request.auser()`` in async mode, and only
+    when ``needs_user`` is set.
+    """
+    sync_capable = True
+    async_capable = True
+    needs_user = False
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.logger = logging.getLogger("request_logger")
-        handler = logging.FileHandler("requests.log")  
-        formatter = logging.Formatter("%(message)s")
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
-        self.logger.setLevel(logging.INFO)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        user = request.user if self.needs_user else None
+        response = self.check(request, user)
+        if response is None:
+            response = self.get_response(request)
+        return self.finish(request, user, response)
+
+    async def __acall__(self, request):
+        user = await request.auser() if self.needs_user else None
+        response = await self.acheck(request, user)
+        if response is None:
+            response = await self.get_response(request)
+        return self.finish(request, user, response)
+
+    def check(self, request, user):
+        return None
+
+    async def acheck(self, request, user):
+        return self.check(request, user)
+
+    def finish(self, request, user, response):
+        return response
+
 
-    def __call__(self, request):  
-        user = request.user.username if request.user.is_authenticated else "Anonymous"
+class RequestLoggingMiddleware(HybridMiddleware):
+    """
+    Logs one JSON line per request with its latency and status. Records go
+    through an in-memory queue to a writer thread, so the request never
+    waits on disk I/O.
+    """
+    needs_user = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.logger = get_request_logger()
 
+    def check(self, request, user):
+        request._logging_started_at = time.perf_counter()
+        return None
+
+    def finish(self, request, user, response):
         self.logger.info(
-            f"{datetime.now()} - User: {user} - Path: {request.path}"
+            "request",
+            extra={
+                "user": user.username if user.is_authenticated else "Anonymous",
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - request._logging_started_at) * 1000, 3),
+            },
         )
-
-        response = self.get_response(request)
         return response
 
 
-class RestrictAccessByTimeMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
-
-    def __call__(self, request):
+class RestrictAccessByTimeMiddleware(HybridMiddleware):
+    def check(self, request, user):
         current_hour = datetime.now().hour  
 
         if current_hour < 6 or current_hour >= 21:
             return HttpResponseForbidden("Access to the chat is restricted during these hours.")
+        return None
 
-        return self.get_response(request)
+class OffensiveLanguageMiddleware(HybridMiddleware):
+    """
+    Rate-limits requests with the rules in settings.RATE_LIMIT (by default
+    5 POSTs per IP per minute). Counters live in a shared backend, so the
+    limit holds across worker processes.
+    """
+    needs_user = True
 
-class OffensiveLanguageMiddleware:
     def __init__(self, get_response):
-        self.get_response = get_response
-        self.ip_request_log = defaultdict(list)
-        self.max_requests = 5   
-        self.time_window = 60   
-
-    def __call__(self, request):
-        if request.method == "POST":
-            ip = self.get_client_ip(request)
-            now = time.time()
+        super().__init__(get_response)
+        self.limiter, self.rules = build_limiter()
+        self.trusted_proxies = get_rate_limit_config()["TRUSTED_PROXIES"]
+
+    def checks_for(self, request, user):
+        ip = self.get_client_ip(request)
+        checks = []
+        for rule in self.rules:
+            key = rule.key_for(request, user, ip)
+            if key is not None:
+                checks.append((key, rule.limit, rule.window))
+        return checks
+
+    def check(self, request, user):
+        if not self.limiter.hit(self.checks_for(request, user)):
+            return self.limit_exceeded()
+        return None
+
+    async def acheck(self, request, user):
+        if not await self.limiter.ahit(self.checks_for(request, user)):
+            return self.limit_exceeded()
+        return None
+
+    def limit_exceeded(self):
+        return HttpResponseForbidden(
+            "Message limit exceeded. Please wait before sending more messages."
+        )
 
-            recent_requests = [
-                t for t in self.ip_request_log[ip] if now - t < self.time_window
+    def get_client_ip(self, request):
+        """
+        The peer address, or with ``TRUSTED_PROXIES`` set to the number of
+        proxies in front of the app, the address the outermost of them saw.
+        Entries left of that are client-supplied and never trusted.
+        """
+        if self.trusted_proxies:
+            forwarded_for = [
+                ip.strip() for ip in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if ip.strip()
             ]
-            self.ip_request_log[ip] = recent_requests
+            if len(forwarded_for) >= self.trusted_proxies:
+                return forwarded_for[-self.trusted_proxies]
+        return request.META.get("REMOTE_ADDR")
 
-            if len(recent_requests) >= self.max_requests:
-                return HttpResponseForbidden(
-                    "Message limit exceeded. Please wait before sending more messages."
-                )
 
-            self.ip_request_log[ip].append(now)
+class RolepermissionMiddleware(HybridMiddleware):
+    needs_user = True
 
-        return self.get_response(request)
-    
-
-class RolepermissionMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
-
-    def __call__(self, request):
-        if not request.user.is_authenticated:
+    def check(self, request, user):
+        if not user.is_authenticated:
             return HttpResponseForbidden("Authentication required.")
 
-        user_role = getattr(request.user, "role", None)
+        user_role = getattr(user, "role", None)
 
         if user_role not in ["admin", "moderator"]:
             return HttpResponseForbidden("You do not have permission to access this resource.")
-
-        return self.get_response(request)
\ No newline at end of file
+        return None
@@ -1,6 +1,7 @@
 from django.db import models
 import uuid
 from django.contrib.auth.models import AbstractUser
+from .managers import ConversationQuerySet
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -13,14 +14,21 @@ class User(AbstractUser):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='guest')
     created_at = models.DateTimeField(auto_now_add=True)
 
-class Conversation:
+class Conversation(models.Model):
     conversation_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
     participants = models.ManyToManyField(User, related_name="conversations")
     created_at = models.DateTimeField(auto_now_add=True)
 
-class Message:
+    objects = ConversationQuerySet.as_manager()
+
+class Message(models.Model):
     message_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
     conversation = models.ForeignKey(Conversation, related_name="messages", on_delete=models.CASCADE)
     sender = models.ForeignKey(User, related_name="messages", on_delete=models.CASCADE)
     message_body = models.TextField()
-    sent_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["conversation", "-sent_at", "-message_id"], name="message_conv_sent_idx"),
+        ]
\ No newline at end of file
@@ -1,12 +1,123 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
 
 class MessagePagination(PageNumberPagination):
     page_size = 20
 
     def get_paginated_response(self, data):
         return Response({
-            'count': self.page.paginator.count,   
+            'count': self.page.paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination on (sent_at, message_id), newest first.
+
+    Every page is a range read that starts right after the last row the
+    client saw, so deep pages cost the same as the first one and no
+    COUNT(*) is ever issued. Cursors are opaque base64 tokens.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_field = 'sent_at'
+    tiebreak_field = 'message_id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, reverse, obj):
+        payload = [
+            int(reverse),
+            getattr(obj, self.ordering_field).isoformat(),
+            str(getattr(obj, self.tiebreak_field)),
+        ]
+        token = urlsafe_b64encode(json.dumps(payload).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            reverse, value, pk = json.loads(urlsafe_b64decode(token.encode('ascii')))
+            value = parse_datetime(value)
+            pk = uuid.UUID(str(pk))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), value, pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        self.reverse = cursor is not None and cursor[0]
+
+        field, tiebreak = self.ordering_field, self.tiebreak_field
+        if self.reverse:
+            queryset = queryset.order_by(field, tiebreak)
+            lookup = 'gt'
+        else:
+            queryset = queryset.order_by('-' + field, '-' + tiebreak)
+            lookup = 'lt'
+
+        if cursor is not None:
+            _, value, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value})
+                | Q(**{field: value, f'{tiebreak}__{lookup}': pk})
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+
+        if self.reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response({
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data
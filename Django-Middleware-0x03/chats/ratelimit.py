@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class LocalBackend:
+    """
+    In-process counter store. Keys expire after their TTL and the store
+    never holds more than ``max_keys`` entries: idle keys are evicted
+    least-recently-used first. Not shared between worker processes.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys, now=None):
+        now = time.time() if now is None else now
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                value, expires_at = entry
+                if expires_at <= now:
+                    del self._data[key]
+                    continue
+                found[key] = value
+        return found
+
+    def incr(self, key, ttl, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            value, expires_at = self._data.pop(key, (0, 0))
+            if expires_at <= now:
+                value, expires_at = 0, now + ttl
+            self._data[key] = (value + 1, expires_at)
+            while len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+            return value + 1
+
+    # Pure in-memory work; nothing to hand off to the event loop.
+    async def aget_many(self, keys, now=None):
+        return self.get_many(keys, now=now)
+
+    async def aincr(self, key, ttl, now=None):
+        return self.incr(key, ttl, now=now)
+
+
+class CacheBackend:
+    """
+    Counter store on a Django cache, shared by every process that uses the
+    same cache server (Redis, Memcached). Entries expire on their own.
+    """
+
+    def __init__(self, alias="default"):
+        self.cache = caches[alias]
+
+    def get_many(self, keys, now=None):
+        return self.cache.get_many(keys)
+
+    def incr(self, key, ttl, now=None):
+        if self.cache.add(key, 1, timeout=ttl):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr().
+            self.cache.set(key, 1, timeout=ttl)
+            return 1
+
+    async def aget_many(self, keys, now=None):
+        return await self.cache.aget_many(keys)
+
+    async def aincr(self, key, ttl, now=None):
+        if await self.cache.aadd(key, 1, timeout=ttl):
+            return 1
+        try:
+            return await self.cache.aincr(key)
+        except ValueError:
+            await self.cache.aset(key, 1, timeout=ttl)
+            return 1
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window counter: keeps one counter per fixed window and weighs
+    the previous window by how much of it still overlaps the sliding one.
+    One read per request plus one increment per rule, whatever the
+    request rate.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def window_keys(self, key, window, now):
+        current = int(now // window)
+        return f"{key}:{current}", f"{key}:{current - 1}"
+
+    def estimate(self, counts, keys, window, now):
+        current_key, previous_key = keys
+        overlap = 1 - (now % window) / window
+        return counts.get(previous_key, 0) * overlap + counts.get(current_key, 0)
+
+    def _plan(self, checks, now):
+        keys = [self.window_keys(key, window, now) for key, _, window in checks]
+        return keys, [key for pair in keys for key in pair]
+
+    def _allowed(self, checks, keys, counts, now):
+        return all(
+            self.estimate(counts, pair, window, now) < limit
+            for (_, limit, window), pair in zip(checks, keys)
+        )
+
+    def hit(self, checks, now=None):
+        """
+        Record one request against every ``(key, limit, window)`` in
+        ``checks``; False if any of them is over its limit. All limits are
+        read before anything is counted, so a rejected request counts
+        against none of them.
+        """
+        now = time.time() if now is None else now
+        keys, flat = self._plan(checks, now)
+        counts = self.backend.get_many(flat, now=now) if flat else {}
+        if not self._allowed(checks, keys, counts, now):
+            return False
+        for (_, _, window), pair in zip(checks, keys):
+            self.backend.incr(pair[0], ttl=2 * window, now=now)
+        return True
+
+    async def ahit(self, checks, now=None):
+        now = time.time() if now is None else now
+        keys, flat = self._plan(checks, now)
+        counts = await self.backend.aget_many(flat, now=now) if flat else {}
+        if not self._allowed(checks, keys, counts, now):
+            return False
+        for (_, _, window), pair in zip(checks, keys):
+            await self.backend.aincr(pair[0], ttl=2 * window, now=now)
+        return True
+
+
+class Rule:
+    """
+    One limit. ``scope`` is "ip" or "user" (anonymous requests skip user
+    rules). With ``path`` set the rule only counts requests under that
+    prefix, separately from other endpoints.
+    """
+
+    def __init__(self, limit, window, scope="ip", methods=("POST",), path=None):
+        self.limit = limit
+        self.window = window
+        self.scope = scope
+        self.methods = {method.upper() for method in methods} if methods else None
+        self.path = path
+
+    def key_for(self, request, user, client_ip):
+        if self.methods is not None and request.method not in self.methods:
+            return None
+        if self.path is not None and not request.path.startswith(self.path):
+            return None
+        if self.scope == "user":
+            if user is None or not user.is_authenticated:
+                return None
+            ident = user.pk
+        else:
+            ident = client_ip
+        return f"ratelimit:{self.scope}:{ident}:{self.path or '*'}:{self.limit}/{self.window}"
+
+
+DEFAULT_RATE_LIMIT = {
+    "BACKEND": "chats.ratelimit.CacheBackend",
+    "OPTIONS": {},
+    "RULES": [
+        {"scope": "ip", "limit": 5, "window": 60, "methods": ["POST"]},
+    ],
+    "TRUSTED_PROXIES": 0,
+}
+
+
+def get_rate_limit_config():
+    return {**DEFAULT_RATE_LIMIT, **getattr(settings, "RATE_LIMIT", {})}
+
+
+def build_limiter(config=None):
+    config = config or get_rate_limit_config()
+    backend = import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+    rules = [Rule(**rule) for rule in config["RULES"]]
+    return SlidingWindowLimiter(backend), rules
@@ -0,0 +1,174 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, RotatingFileHandler, TimedRotatingFileHandler
+
+from django.conf import settings
+
+LOGGER_NAME = "request_logger"
+
+DEFAULTS = {
+    "PATH": "requests.log",
+    "ROTATE": "size",
+    "MAX_BYTES": 10 * 1024 * 1024,
+    "WHEN": "midnight",
+    "BACKUP_COUNT": 5,
+    "BATCH_SIZE": 100,
+    "FLUSH_INTERVAL": 1.0,
+    "QUEUE_SIZE": 10000,
+}
+
+# Attributes every LogRecord has; anything else was passed through ``extra``.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonLineFormatter(logging.Formatter):
+    """One JSON object per line: the message plus every ``extra`` field."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (name, value) for name, value in vars(record).items() if name not in _RECORD_ATTRS
+        )
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking or erroring."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener:
+    """
+    Background thread that drains the log queue and writes records to a
+    rotating file handler in batches: up to ``batch_size`` records per
+    write, flushed at least every ``flush_interval`` seconds.
+    """
+
+    _stop = object()
+
+    def __init__(self, log_queue, handler, batch_size, flush_interval):
+        self.queue = log_queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="request-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.queue.put(self._stop)
+        self._thread.join()
+        self._thread = None
+        self.handler.close()
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [record]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = self._stop in batch
+            self.write([record for record in batch if record is not self._stop])
+            if stopping:
+                return
+
+    def write(self, records):
+        if not records:
+            return
+        handler = self.handler
+        handler.acquire()
+        try:
+            for record in records:
+                if handler.shouldRollover(record):
+                    handler.doRollover()
+                if handler.stream is None:
+                    handler.stream = handler._open()
+                handler.stream.write(handler.format(record) + handler.terminator)
+            handler.flush()
+        except Exception:
+            handler.handleError(records[-1])
+        finally:
+            handler.release()
+
+
+def _build_file_handler(config):
+    if config["ROTATE"] == "time":
+        handler = TimedRotatingFileHandler(
+            config["PATH"], when=config["WHEN"], backupCount=config["BACKUP_COUNT"], delay=True
+        )
+    else:
+        handler = RotatingFileHandler(
+            config["PATH"], maxBytes=config["MAX_BYTES"], backupCount=config["BACKUP_COUNT"], delay=True
+        )
+    handler.setFormatter(JsonLineFormatter())
+    return handler
+
+
+_setup_lock = threading.Lock()
+_listener = None
+
+
+def get_request_logger():
+    """
+    The request logger, wired once per process to a queue drained by a
+    writer thread. Safe to call from every middleware instance.
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    with _setup_lock:
+        if _listener is None:
+            config = {**DEFAULTS, **getattr(settings, "REQUEST_LOG", {})}
+            log_queue = queue.Queue(maxsize=config["QUEUE_SIZE"])
+            _listener = BatchingQueueListener(
+                log_queue, _build_file_handler(config), config["BATCH_SIZE"], config["FLUSH_INTERVAL"]
+            )
+            _listener.start()
+            logger.addHandler(DroppingQueueHandler(log_queue))
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+    return logger
+
+
+def stop_request_logger():
+    """
+    Write out what is queued, stop the writer thread and detach the queue
+    handler. The next get_request_logger() starts over with the current
+    settings.REQUEST_LOG.
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    with _setup_lock:
+        if _listener is None:
+            return
+        for handler in list(logger.handlers):
+            if isinstance(handler, DroppingQueueHandler):
+                logger.removeHandler(handler)
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_request_logger)
@@ -0,0 +1,5 @@
+from django.db.models.signals import m2m_changed
+
+from .membership import Participants, participants_changed
+
+m2m_changed.connect(participants_changed, sender=Participants, dispatch_uid="chats_participants_changed")
@@ -1,3 +1,287 @@
-from django.test import TestCase
+import json
+import logging
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import path
+
+from . import middleware as chats_middleware
+from .middleware import OffensiveLanguageMiddleware, RequestLoggingMiddleware
+from .models import Conversation, Message, User
+from .ratelimit import CacheBackend, LocalBackend, SlidingWindowLimiter
+from .request_log import LOGGER_NAME, stop_request_logger
+
+
+class QueryPlanTests(TestCase):
+    """
+    Guards the hot queries against regressions to full table scans: seeds
+    enough rows, and statistics, that a poorly matching index would lose
+    to a scan, then checks each query's EXPLAIN output for its index.
+    """
+
+    conversations_count = 10
+    messages_per_conversation = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com", first_name="User", last_name=str(i))
+            for i in range(cls.conversations_count + 1)
+        )
+        cls.conversations = Conversation.objects.bulk_create(
+            Conversation() for _ in range(cls.conversations_count)
+        )
+        messages = []
+        for c, conversation in enumerate(cls.conversations):
+            members = cls.users[c], cls.users[c + 1]
+            conversation.participants.add(*members)
+            messages.extend(
+                Message(conversation=conversation, sender=members[i % 2], message_body=f"message {i}")
+                for i in range(cls.messages_per_conversation)
+            )
+        Message.objects.bulk_create(messages)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.conversation = cls.conversations[0]
+
+    def explain(self, queryset):
+        if connection.vendor == "postgresql":
+            # Test tables are small enough that a sequential scan always wins.
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = self.explain(queryset)
+        self.assertIn(index_name, plan, f"{index_name} not used:\n{plan}")
+
+    def test_message_list_page(self):
+        queryset = Message.objects.filter(conversation=self.conversation).order_by("-sent_at", "-message_id")
+        self.assertUsesIndex(queryset[:20], "message_conv_sent_idx")
+
+    def test_inbox_latest_message(self):
+        # The latest-message subqueries run once per conversation listed.
+        queryset = Conversation.objects.filter(participants=self.users[0]).with_inbox_summary()
+        self.assertUsesIndex(queryset, "message_conv_sent_idx")
+
+
+class SlidingWindowLimiterTests(SimpleTestCase):
+    """Runs against LocalBackend; CacheBackendLimiterTests repeats it on the cache."""
+
+    def make_backend(self):
+        return LocalBackend()
+
+    def setUp(self):
+        cache.clear()
+        self.limiter = SlidingWindowLimiter(self.make_backend())
+
+    def hit(self, now, limit=2, window=60):
+        return self.limiter.hit([("key", limit, window)], now=now)
+
+    def test_limit_is_hit_at_the_window_edge(self):
+        self.assertEqual([self.hit(0.0), self.hit(1.0), self.hit(59.9)], [True, True, False])
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        self.hit(0.0)
+        self.hit(1.0)
+        # Right after the edge the previous window still counts in full...
+        self.assertFalse(self.hit(60.0))
+        # ...half way through the next one, its two requests weigh one.
+        self.assertTrue(self.hit(90.0))
+        self.assertFalse(self.hit(90.0))
+        # Two windows on, nothing is left of it.
+        self.assertTrue(self.hit(180.0))
+
+    def test_rejected_request_counts_against_no_rule(self):
+        checks = [("wide", 5, 60), ("narrow", 1, 60)]
+        self.assertTrue(self.limiter.hit(checks, now=0.0))
+        self.assertFalse(self.limiter.hit(checks, now=1.0))
+        self.assertEqual(self.limiter.backend.get_many(["wide:0"], now=1.0), {"wide:0": 1})
+
+    async def test_async_hit_matches_sync(self):
+        checks = [("key", 2, 60)]
+        results = [await self.limiter.ahit(checks, now=now) for now in (0.0, 1.0, 59.9)]
+        self.assertEqual(results, [True, True, False])
+
+
+class CacheBackendLimiterTests(SlidingWindowLimiterTests):
+    def make_backend(self):
+        return CacheBackend()
+
+
+class LocalBackendTests(SimpleTestCase):
+    def test_keys_expire_after_their_ttl(self):
+        backend = LocalBackend()
+        backend.incr("key", ttl=10, now=0)
+        self.assertEqual(backend.get_many(["key"], now=9), {"key": 1})
+        self.assertEqual(backend.get_many(["key"], now=10), {})
+        self.assertEqual(backend.incr("key", ttl=10, now=10), 1)
+
+    def test_least_recently_used_key_is_evicted(self):
+        backend = LocalBackend(max_keys=2)
+        for key in ("a", "b", "a", "c"):
+            backend.incr(key, ttl=60, now=0)
+        self.assertEqual(backend.get_many(["a", "b", "c"], now=0), {"a": 2, "c": 1})
+
+
+@override_settings(RATE_LIMIT={
+    "BACKEND": "chats.ratelimit.LocalBackend",
+    "RULES": [{"scope": "ip", "limit": 1, "window": 60, "methods": ["POST"]}],
+})
+class RateLimitMiddlewareTests(SimpleTestCase):
+    def post(self, middleware, **meta):
+        request = RequestFactory().post("/api/conversations/", **meta)
+        request.user = AnonymousUser()
+        return middleware(request).status_code
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        middleware = OffensiveLanguageMiddleware(lambda request: HttpResponse())
+        self.assertEqual(self.post(middleware, REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="1.1.1.1"), 200)
+        self.assertEqual(self.post(middleware, REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="2.2.2.2"), 403)
+
+    def test_trusted_proxy_address_is_read_from_the_right(self):
+        with self.settings(RATE_LIMIT={
+            "BACKEND": "chats.ratelimit.LocalBackend",
+            "RULES": [{"scope": "ip", "limit": 1, "window": 60, "methods": ["POST"]}],
+            "TRUSTED_PROXIES": 1,
+        }):
+            middleware = OffensiveLanguageMiddleware(lambda request: HttpResponse())
+        self.assertEqual(self.post(middleware, REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="9.9.9.9, 1.1.1.1"), 200)
+        self.assertEqual(self.post(middleware, REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="8.8.8.8, 1.1.1.1"), 403)
+        self.assertEqual(self.post(middleware, REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="2.2.2.2"), 200)
+
+
+class TemporaryRequestLogMixin:
+    """Sends the request log to a file of its own for each test."""
+
+    def setUp(self):
+        super().setUp()
+        stop_request_logger()
+        self.addCleanup(stop_request_logger)
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        self.log_path = Path(log_dir.name) / "requests.log"
+        log_settings = self.settings(REQUEST_LOG={"PATH": str(self.log_path), "FLUSH_INTERVAL": 0.05})
+        log_settings.enable()
+        self.addCleanup(log_settings.disable)
+
+    def logged_lines(self):
+        stop_request_logger()  # Waits for the writer thread to finish.
+        return self.log_path.read_text().splitlines() if self.log_path.exists() else []
+
+
+class RequestLoggingMiddlewareTests(TemporaryRequestLogMixin, SimpleTestCase):
+    def get(self, middleware):
+        request = RequestFactory().get("/api/conversations/")
+        request.user = AnonymousUser()
+        return middleware(request)
+
+    def test_request_writes_one_line(self):
+        self.get(RequestLoggingMiddleware(lambda request: HttpResponse(status=204)))
+        [line] = self.logged_lines()
+        entry = json.loads(line)
+        self.assertEqual((entry["method"], entry["path"], entry["status"]), ("GET", "/api/conversations/", 204))
+
+    def test_recreated_middleware_adds_no_handler(self):
+        first = RequestLoggingMiddleware(lambda request: HttpResponse())
+        second = RequestLoggingMiddleware(lambda request: HttpResponse())
+        self.assertEqual(len(logging.getLogger(LOGGER_NAME).handlers), 1)
+        self.get(second)
+        self.assertEqual(len(self.logged_lines()), 1)
+        self.assertIs(first.logger, second.logger)
+
+
+def hybrid_view(request):
+    return HttpResponse("ok")
+
+
+urlpatterns = [path("hybrid/", hybrid_view)]
+
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    MIDDLEWARE=[
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+        "chats.middleware.RequestLoggingMiddleware",
+        "chats.middleware.RestrictAccessByTimeMiddleware",
+        "chats.middleware.OffensiveLanguageMiddleware",
+        "chats.middleware.RolepermissionMiddleware",
+    ],
+    RATE_LIMIT={
+        "BACKEND": "chats.ratelimit.LocalBackend",
+        "RULES": [{"scope": "ip", "limit": 1, "window": 60, "methods": ["POST"]}],
+    },
+)
+class HybridMiddlewareTests(TemporaryRequestLogMixin, TestCase):
+    """The chats stack must answer the same whether Django runs it sync (WSGI) or async (ASGI)."""
+
+    # (user, hour, method) -> status of two requests in a row.
+    scenarios = {
+        ("admin", 12, "get"): [200, 200],
+        ("guest", 12, "get"): [403, 403],
+        (None, 12, "get"): [403, 403],
+        ("admin", 22, "get"): [403, 403],
+        ("admin", 12, "post"): [200, 403],
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            role: User.objects.create_user(username=role, email=f"{role}@example.com", password="pw", role=role)
+            for role in ("admin", "guest")
+        }
+
+    def clock(self, hour):
+        clock = mock.patch.object(chats_middleware, "datetime")
+        clock.start().now.return_value.hour = hour
+        return clock
+
+    def test_sync_stack(self):
+        results = {}
+        for user, hour, method in self.scenarios:
+            client = Client()
+            if user:
+                client.force_login(self.users[user])
+            clock = self.clock(hour)
+            try:
+                results[user, hour, method] = [getattr(client, method)("/hybrid/").status_code for _ in range(2)]
+            finally:
+                clock.stop()
+        self.assertEqual(results, self.scenarios)
+        self.assertEqual(len(self.logged_lines()), 2 * len(self.scenarios))
+
+    async def test_async_stack(self):
+        results = {}
+        for user, hour, method in self.scenarios:
+            client = AsyncClient()
+            if user:
+                await client.aforce_login(self.users[user])
+            clock = self.clock(hour)
+            try:
+                results[user, hour, method] = [
+                    (await getattr(client, method)("/hybrid/")).status_code for _ in range(2)
+                ]
+            finally:
+                clock.stop()
+        self.assertEqual(results, self.scenarios)
+        self.assertEqual(len(self.logged_lines()), 2 * len(self.scenarios))
+
+    def test_middleware_follows_the_handler_mode(self):
+        async def async_view(request):
+            return HttpResponse()
+
+        for name in ("RequestLoggingMiddleware", "RestrictAccessByTimeMiddleware",
+                     "OffensiveLanguageMiddleware", "RolepermissionMiddleware"):
+            with self.subTest(name):
+                middleware_class = getattr(chats_middleware, name)
+                self.assertTrue(iscoroutinefunction(middleware_class(async_view)))
+                self.assertFalse(iscoroutinefunction(middleware_class(hybrid_view)))
@@ -7,8 +7,9 @@ from .models import Message, Conversation
 from .serializers import ConversationSerializer, MessageSerializer, UserSerializer
 from .models import User
 from .permissions import IsParticipantOfConversation
+from .membership import is_participant
 from .filters import MessageFilter
-from .pagination import MessagePagination
+from .pagination import MessageCursorPagination
 
 
 class ConversationViewSet(viewsets.ModelViewSet):
@@ -17,7 +18,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsParticipantOfConversation]
 
     def get_queryset(self):
-        return Conversation.objects.filter(participants=self.request.user)
+        return Conversation.objects.filter(participants=self.request.user).with_inbox_summary()
 
     def create(self, request, *args, **kwargs):
         participants_ids = request.data.get("participants", [])
@@ -37,12 +38,11 @@ class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.all().order_by("-sent_at")
     serializer_class = MessageSerializer
     permission_classes = [IsParticipantOfConversation]
-    pagination_class = MessagePagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # Keyset pagination owns the ordering, so OrderingFilter is not offered here.
+    pagination_class = MessageCursorPagination
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_class = MessageFilter
     search_fields = ["message_body"]
-    ordering_fields = ["sent_at"]
-    ordering = ["-sent_at"]
 
     def get_queryset(self):
         conversation_id = self.request.query_params.get("conversation_id")
@@ -54,17 +54,14 @@ class MessageViewSet(viewsets.ModelViewSet):
         conversation_id = request.data.get("conversation")
         message_body = request.data.get("message_body")
 
-        try:
-            conversation = Conversation.objects.get(id=conversation_id)
-        except Conversation.DoesNotExist:
-            return Response({"error": "Conversation not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        if request.user not in conversation.participants.all():
+        if not is_participant(request.user, conversation_id, request):
+            if not Conversation.objects.filter(pk=conversation_id).exists():
+                return Response({"error": "Conversation not found."}, status=status.HTTP_404_NOT_FOUND)
             return Response({"error": "You are not a participant of this conversation."},
                             status=status.HTTP_403_FORBIDDEN)
 
         message = Message.objects.create(
-            conversation=conversation,
+            conversation_id=conversation_id,
             sender=request.user,
             message_body=message_body,
         )
@@ -145,4 +145,31 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ]
-}
\ No newline at end of file
+}
+
+# Rate limits enforced by chats.middleware.OffensiveLanguageMiddleware.
+# CacheBackend shares counters through the default cache; point CACHES at
+# Redis or Memcached so all workers see the same counts (the default
+# LocMemCache is per process). chats.ratelimit.LocalBackend needs no cache.
+# Clients are keyed by REMOTE_ADDR; behind N reverse proxies set
+# TRUSTED_PROXIES to N to read the client address from X-Forwarded-For.
+RATE_LIMIT = {
+    'BACKEND': 'chats.ratelimit.CacheBackend',
+    'RULES': [
+        {'scope': 'ip', 'limit': 5, 'window': 60, 'methods': ['POST']},
+        {'scope': 'user', 'limit': 30, 'window': 60, 'methods': ['POST']},
+        {'scope': 'user', 'limit': 10, 'window': 60, 'methods': ['POST'], 'path': '/api/conversations/'},
+    ],
+    'TRUSTED_PROXIES': 0,
+}
+
+# JSON request log written by chats.middleware.RequestLoggingMiddleware from
+# a background thread. ROTATE is "size" (MAX_BYTES) or "time" (WHEN).
+REQUEST_LOG = {
+    'PATH': BASE_DIR / 'requests.log',
+    'ROTATE': 'size',
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+}
@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+"""
+Load test for the messaging API: seeds users, conversations and threaded
+messages, then drives a weighted mix of inbox listing, message pagination,
+thread fetching, unread polling and message creation from concurrent
+clients, and reports throughput and latency percentiles per operation.
+
+Run from the project directory:
+
+    python benchmarks/messaging_api.py --users 200 --conversations 500 \\
+        --messages 20000 --requests 5000 --concurrency 16
+
+By default everything runs offline in a temporary SQLite database. With
+--database postgres the server is taken from the usual PG* environment
+variables (PGHOST, PGPORT, PGUSER, PGPASSWORD, PGDATABASE); the benchmark
+creates its own test database there and drops it afterwards.
+
+The bulk endpoint is left out of the default mix; add e.g. "bulk=5" to
+--mix to include it.
+
+Requests go through the full Django and DRF stack in-process, so the
+numbers measure the application and the database, not a network or a web
+server. Use the same --seed to compare runs.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from django.conf import settings
+
+OPERATIONS = ("inbox", "messages", "thread", "unread", "unread_count", "create", "bulk")
+DEFAULT_MIX = "inbox=20,messages=25,thread=10,unread=10,unread_count=20,create=15"
+
+
+def database_settings(args):
+    if args.database == "postgres":
+        return {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("PGDATABASE", "postgres"),
+            "USER": os.environ.get("PGUSER", ""),
+            "PASSWORD": os.environ.get("PGPASSWORD", ""),
+            "HOST": os.environ.get("PGHOST", ""),
+            "PORT": os.environ.get("PGPORT", ""),
+            "TEST": {"NAME": "test_messaging_benchmark"},
+        }
+    path = str(Path(tempfile.mkdtemp(prefix="messaging-bench-")) / "bench.sqlite3")
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": path,
+        "TEST": {"NAME": path},
+        # WAL lets readers run alongside the single writer; IMMEDIATE makes
+        # writers queue on the lock instead of failing when they upgrade.
+        "OPTIONS": {
+            "timeout": 30,
+            "transaction_mode": "IMMEDIATE",
+            "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+        },
+    }
+
+
+def configure(args):
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY="benchmark",
+        ALLOWED_HOSTS=["*"],
+        ROOT_URLCONF=__name__,
+        MIDDLEWARE=[],
+        INSTALLED_APPS=[
+            "django.contrib.auth",
+            "django.contrib.contenttypes",
+            "rest_framework",
+            "django_filters",
+            "messaging.apps.MessagingConfig",
+        ],
+        AUTH_USER_MODEL="messaging.User",
+        DATABASES={"default": database_settings(args)},
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        USE_TZ=True,
+        REST_FRAMEWORK={
+            "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+            "PAGE_SIZE": 20,
+            # Clients are force-authenticated; no session or token lookups.
+            "DEFAULT_AUTHENTICATION_CLASSES": [],
+            "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
+            "UNAUTHENTICATED_USER": None,
+        },
+        NOTIFICATIONS={"MODE": "batched"},
+        PROFILING={"ENABLED": False},
+    )
+
+    import django
+
+    django.setup()
+
+    from django.urls import include, path
+
+    global urlpatterns
+    urlpatterns = [path("", include("messaging.urls"))]
+
+
+def seed(users, conversations, messages, reply_ratio, rng):
+    """
+    Create the data set with bulk inserts, then fill in what the save()
+    path and signals would have: thread paths, unread counters and the
+    search index. Returns {user: [(conversation_id, [member ids]), ...]}.
+    """
+    from messaging.counters import rebuild_unread_counters
+    from messaging.membership import Participants
+    from messaging.models import Conversation, Message, User
+    from messaging.search import rebuild_index
+
+    user_rows = User.objects.bulk_create(
+        User(username=f"bench{i}", email=f"bench{i}@example.com", first_name="Bench", last_name=str(i))
+        for i in range(users)
+    )
+    conversation_rows = Conversation.objects.bulk_create(Conversation() for _ in range(conversations))
+
+    members = {}
+    links = []
+    for conversation in conversation_rows:
+        chosen = rng.sample(user_rows, rng.randint(2, min(4, users)))
+        members[conversation.pk] = [user.pk for user in chosen]
+        links.extend(Participants(conversation_id=conversation.pk, user_id=user.pk) for user in chosen)
+    Participants.objects.bulk_create(links, batch_size=1000)
+
+    history = defaultdict(list)
+    batch = []
+    for _ in range(messages):
+        conversation_id = rng.choice(conversation_rows).pk
+        sender_id, receiver_id = rng.sample(members[conversation_id], 2)
+        earlier = history[conversation_id]
+        # Replies favour recent messages, which grows deep threads as well as wide ones.
+        parent = rng.choice(earlier[-20:]) if earlier and rng.random() < reply_ratio else None
+        message = Message(
+            conversation_id=conversation_id,
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            parent_message=parent,
+            content=f"benchmark message {len(batch)} " + " ".join(rng.choices(WORDS, k=rng.randint(3, 30))),
+        )
+        earlier.append(message)
+        batch.append(message)
+    # Parents come before their replies, so plain batch order satisfies the foreign key.
+    Message.objects.bulk_create(batch, batch_size=1000)
+    Message.objects.rebuild_paths()
+    rebuild_unread_counters()
+    rebuild_index()
+
+    by_user = defaultdict(list)
+    for conversation_id, member_ids in members.items():
+        for user_id in member_ids:
+            by_user[user_id].append((conversation_id, member_ids))
+    by_id = {user.pk: user for user in user_rows}
+    return {by_id[user_id]: entries for user_id, entries in by_user.items()}
+
+
+WORDS = (
+    "hello meeting tomorrow lunch project deadline review update call later thanks "
+    "report draft budget travel office weekend photo link ticket release bug fix"
+).split()
+
+
+class Worker:
+    def __init__(self, memberships, mix, rng, pages, bulk_size):
+        from rest_framework.test import APIClient
+
+        self.client = APIClient()
+        self.memberships = memberships
+        self.users = list(memberships)
+        self.operations, self.weights = zip(*mix.items())
+        self.rng = rng
+        self.pages = pages
+        self.bulk_size = bulk_size
+
+    def step(self, record):
+        user = self.rng.choice(self.users)
+        self.client.force_authenticate(user)
+        conversation_id, member_ids = self.rng.choice(self.memberships[user])
+        operation = self.rng.choices(self.operations, self.weights)[0]
+        getattr(self, operation)(record, user, conversation_id, member_ids)
+
+    def timed(self, record, operation, method, url, **kwargs):
+        started = time.perf_counter()
+        response = getattr(self.client, method)(url, **kwargs)
+        record(operation, time.perf_counter() - started, response.status_code < 400)
+        return response
+
+    def inbox(self, record, user, conversation_id, member_ids):
+        self.timed(record, "inbox", "get", "/conversations/")
+
+    def messages(self, record, user, conversation_id, member_ids):
+        url = f"/conversations/{conversation_id}/messages/?conversation_id={conversation_id}"
+        for _ in range(self.pages):
+            response = self.timed(record, "messages", "get", url)
+            url = response.data.get("next") if response.status_code == 200 else None
+            if not url:
+                break
+
+    def thread(self, record, user, conversation_id, member_ids):
+        self.timed(record, "thread", "get", f"/messages/threads/?conversation_id={conversation_id}&limit=10")
+
+    def unread(self, record, user, conversation_id, member_ids):
+        self.timed(record, "unread", "get", "/messages/unread/")
+
+    def unread_count(self, record, user, conversation_id, member_ids):
+        self.timed(record, "unread_count", "get", f"/messages/unread/count/?conversation_id={conversation_id}")
+
+    def create(self, record, user, conversation_id, member_ids):
+        receiver_id = self.rng.choice([pk for pk in member_ids if pk != user.pk])
+        self.timed(record, "create", "post", f"/conversations/{conversation_id}/messages/", format="json", data={
+            "conversation": str(conversation_id),
+            "receiver": str(receiver_id),
+            "content": " ".join(self.rng.choices(WORDS, k=self.rng.randint(3, 30))),
+        })
+
+    def bulk(self, record, user, conversation_id, member_ids):
+        others = [pk for pk in member_ids if pk != user.pk]
+        self.timed(record, "bulk", "post", f"/conversations/{conversation_id}/messages/bulk/", format="json", data=[
+            {
+                "conversation": str(conversation_id),
+                "receiver": str(self.rng.choice(others)),
+                "content": " ".join(self.rng.choices(WORDS, k=self.rng.randint(3, 30))),
+            }
+            for _ in range(self.bulk_size)
+        ])
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __call__(self, operation, elapsed, ok):
+        with self._lock:
+            self.latencies[operation].append(elapsed)
+            if not ok:
+                self.errors[operation] += 1
+
+
+def run(memberships, mix, total, concurrency, seed, pages, bulk_size):
+    from django.db import connections
+
+    recorder = Recorder()
+    remaining = iter(range(total))
+    remaining_lock = threading.Lock()
+
+    def work(index):
+        worker = Worker(memberships, mix, random.Random(seed * 1000 + index), pages, bulk_size)
+        try:
+            while True:
+                with remaining_lock:
+                    if next(remaining, None) is None:
+                        return
+                worker.step(recorder)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, recorder
+
+
+def report(elapsed, recorder):
+    def pct(ordered, p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    total = sum(len(latencies) for latencies in recorder.latencies.values())
+    print(f"{total} requests in {elapsed:.2f} s: {total / elapsed:.0f} req/s\n")
+    print(f"{'operation':<14}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for operation in OPERATIONS:
+        latencies = sorted(recorder.latencies.get(operation, ()))
+        if not latencies:
+            continue
+        print(
+            f"{operation:<14}{len(latencies):>7}{recorder.errors[operation]:>8}{len(latencies) / elapsed:>9.0f}"
+            f"{pct(latencies, 0.50):>10.2f}{pct(latencies, 0.95):>10.2f}{pct(latencies, 0.99):>10.2f}"
+            f"{statistics.mean(latencies) * 1000:>10.2f}"
+        )
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database", choices=("sqlite", "postgres"), default="sqlite")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--reply-ratio", type=float, default=0.6, help="share of messages that reply to another")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--pages", type=int, default=3, help="message list pages followed per visit")
+    parser.add_argument("--bulk-size", type=int, default=100, help="messages per bulk request")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"default: {DEFAULT_MIX}")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error("--users must be at least 2")
+
+    configure(args)
+
+    from django.db import connection
+
+    from messaging.notifications import flush_notifications
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        started = time.perf_counter()
+        memberships = seed(args.users, args.conversations, args.messages, args.reply_ratio, random.Random(args.seed))
+        print(
+            f"{connection.vendor}: seeded {args.users} users, {args.conversations} conversations, "
+            f"{args.messages} messages in {time.perf_counter() - started:.1f} s"
+        )
+        run(memberships, args.mix, args.warmup, args.concurrency, args.seed + 1, args.pages, args.bulk_size)
+        elapsed, recorder = run(
+            memberships, args.mix, args.requests, args.concurrency, args.seed, args.pages, args.bulk_size
+        )
+        report(elapsed, recorder)
+        flush_notifications()
+    finally:
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULT_TTL = 60 * 60
+
+
+def _version_key(conversation_id):
+    return f"messaging:conversation:{conversation_id}:version"
+
+
+def conversation_version(conversation_id):
+    key = _version_key(conversation_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock rather than 1, so a version evicted from the
+        # cache can never come back as a number older entries were keyed on.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(conversation_id):
+    key = _version_key(conversation_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        conversation_version(conversation_id)
+
+
+def bump_conversation_version(conversation_id, using=None):
+    """
+    Invalidate every cached response for a conversation once the current
+    transaction commits (right away outside one). Bumping before the
+    commit would let a request in between cache the old rows under the
+    new version, where they would stay until the TTL ran out.
+    """
+    transaction.on_commit(lambda: _bump(conversation_id), using=using)
+
+
+def message_list_cache_key(conversation_id, request):
+    """
+    Key for a cached message list page, shared by all participants of the
+    conversation. That is safe because the caller checks membership before
+    every lookup, hit or miss, and a message list page holds nothing that
+    differs between the users allowed to see it. A view that adds
+    per-user data to the page must add the user to this key.
+    """
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    )
+    digest = hashlib.sha256(
+        repr((request.get_host(), request.path, params)).encode("utf-8")
+    ).hexdigest()
+    version = conversation_version(conversation_id)
+    return f"messaging:messages:{conversation_id}:v{version}:{digest}"
+
+
+def message_list_ttl():
+    return getattr(settings, "MESSAGE_LIST_CACHE_TTL", DEFAULT_TTL)
@@ -0,0 +1,77 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Message, UnreadCounter
+
+
+def _adjust(user_id, scope, delta):
+    if not delta:
+        return
+    counter = UnreadCounter.objects.filter(user_id=user_id, conversation_id=scope)
+    # Never below zero: a miscount is repaired by rebuild_unread_counters,
+    # a negative badge would be shown as is.
+    if counter.update(count=Greatest(F("count") + delta, 0)) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            UnreadCounter.objects.create(user_id=user_id, conversation_id=scope, count=delta)
+    except IntegrityError:
+        # Another request created the row first; add to it instead.
+        counter.update(count=F("count") + delta)
+
+
+def adjust_unread(user_id, conversation_id, delta):
+    """Shift a user's unread count in one conversation, and their total, by ``delta``."""
+    _adjust(user_id, conversation_id, delta)
+    _adjust(user_id, None, delta)
+
+
+def adjust_unread_many(counts, sign=1):
+    """Apply ``{(user_id, conversation_id): n}`` at once, e.g. after a bulk write."""
+    totals = {}
+    for (user_id, conversation_id), n in counts.items():
+        _adjust(user_id, conversation_id, sign * n)
+        totals[user_id] = totals.get(user_id, 0) + n
+    for user_id, n in totals.items():
+        _adjust(user_id, None, sign * n)
+
+
+def unread_counts_for(messages):
+    """Count the unread rows in ``messages`` per (receiver, conversation)."""
+    rows = (
+        messages.unread()
+        .order_by()
+        .values("receiver_id", "conversation_id")
+        .annotate(n=Count("pk"))
+    )
+    return {(row["receiver_id"], row["conversation_id"]): row["n"] for row in rows}
+
+
+def unread_count(user, conversation_id=None):
+    return (
+        UnreadCounter.objects
+        .filter(user=user, conversation_id=conversation_id)
+        .values_list("count", flat=True)
+        .first()
+    ) or 0
+
+
+@transaction.atomic
+def rebuild_unread_counters(user=None):
+    """Recompute counters from the messages table, for repair after drift."""
+    counters = UnreadCounter.objects.all()
+    messages = Message.objects.all()
+    if user is not None:
+        counters = counters.filter(user=user)
+        messages = messages.filter(receiver=user)
+    counters.delete()
+    counts = unread_counts_for(messages)
+    totals = {}
+    rows = []
+    for (user_id, conversation_id), n in counts.items():
+        rows.append(UnreadCounter(user_id=user_id, conversation_id=conversation_id, count=n))
+        totals[user_id] = totals.get(user_id, 0) + n
+    rows.extend(UnreadCounter(user_id=user_id, count=n) for user_id, n in totals.items())
+    UnreadCounter.objects.bulk_create(rows)
+    return len(rows)
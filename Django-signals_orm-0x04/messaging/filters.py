@@ -1,5 +1,7 @@
 import django_filters
+from rest_framework import filters
 from .models import Message
+from .search import get_backend
 
 class MessageFilter(django_filters.FilterSet):
     sender_id = django_filters.UUIDFilter(field_name="sender__user_id")
@@ -9,3 +11,13 @@ class MessageFilter(django_filters.FilterSet):
     class Meta:
         model = Message
         fields = ["sender_id", "sent_after", "sent_before"]
+
+
+class MessageSearchFilter(filters.SearchFilter):
+    """?search= answered from the full-text index instead of LIKE '%term%' on every message."""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+        return get_backend().filter(queryset, query)
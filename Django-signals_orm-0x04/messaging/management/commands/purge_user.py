@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from messaging.purge import pending_purges, purge_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete a user and everything they own in chunks. Safe to re-run after an interruption; "
+        "--pending resumes every purge that was requested but never finished."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_id", nargs="?")
+        parser.add_argument("--pending", action="store_true", help="resume all unfinished purges")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["pending"] == bool(options["user_id"]):
+            raise CommandError("Give either a user_id or --pending.")
+
+        def progress(step, rows):
+            if rows:
+                self.stdout.write(f"{step}: -{rows}")
+
+        user_ids = pending_purges() if options["pending"] else [options["user_id"]]
+        for user_id in user_ids:
+            totals = purge_user(user_id, chunk_size=options["chunk_size"], progress=progress)
+            for step, rows in totals.items():
+                self.stdout.write(self.style.SUCCESS(f"{user_id} {step}: {rows} total"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from messaging.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Re-index every message in the search tables created by the migrations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} messages."))
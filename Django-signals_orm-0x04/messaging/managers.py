@@ -1,5 +1,221 @@
-from django.db import models
+from django.apps import apps
+from django.db import connections, models, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .cache import bump_conversation_version
+
+
+class MessageQuerySet(models.QuerySet):
+    def _thread_q(self, root):
+        prefix = root.thread_path
+        if not prefix:
+            # Saved before paths were tracked (see rebuild_paths); an empty
+            # prefix would match every message.
+            return Q(pk=root.pk)
+        condition = Q(thread_path__startswith=prefix)
+        if connections[self.db].vendor == "sqlite":
+            # SQLite's LIKE is case-insensitive, so it cannot use the index,
+            # but its text comparisons are always bytewise. Paths only hold
+            # hex digits and "/", and "0" sorts right after "/".
+            condition &= Q(thread_path__gte=prefix, thread_path__lt=prefix[:-1] + "0")
+        return condition
+
+    def subtree(self, root, include_root=True):
+        """
+        All replies under ``root`` at any depth, as one prefix scan on the
+        indexed thread path.
+        """
+        queryset = self.filter(self._thread_q(root))
+        if not include_root:
+            queryset = queryset.exclude(pk=root.pk)
+        return queryset
+
+    def subtrees(self, roots, max_depth=None):
+        """
+        The threads under each of ``roots``, roots included, in one query.
+        With ``max_depth``, replies more than ``max_depth`` levels below
+        their root are left out.
+        """
+        condition = Q()
+        for root in roots:
+            thread = self._thread_q(root)
+            if max_depth is not None:
+                thread &= Q(thread_depth__lte=root.thread_depth + max_depth)
+            condition |= thread
+        return self.filter(condition) if roots else self.none()
+
+    def ancestors(self, message, include_self=False):
+        """Every message above ``message`` in its thread, root first."""
+        ids = message.path_ids()
+        if not include_self:
+            ids = ids[:-1]
+        return self.filter(pk__in=ids).order_by("thread_depth")
+
+    def unread(self):
+        """
+        Messages their receiver has not read: those after the receiver's
+        read watermark in the conversation, or all of them if there is none.
+        """
+        read_state = apps.get_model("messaging", "ConversationReadState")
+        covered = read_state.objects.filter(
+            user=OuterRef("receiver"), conversation=OuterRef("conversation")
+        ).filter(
+            Q(last_read_at__gt=OuterRef("timestamp"))
+            | Q(last_read_at=OuterRef("timestamp"), last_read_id__gte=OuterRef("message_id"))
+        )
+        return self.filter(~Exists(covered))
+
+
+class MessageManager(models.Manager.from_queryset(MessageQuerySet)):
+    def rebuild_paths(self, batch_size=500):
+        """
+        Recompute every thread path and depth, e.g. for rows saved before
+        they were tracked. Runs one pass per reply level, reading each
+        level in primary key order ``batch_size`` rows at a time with
+        their parent's path joined in, so memory and query size stay
+        bounded however big the table is. Returns the number of levels.
+        """
+        self.update(thread_path="", thread_depth=0)
+        depth = 0
+        while True:
+            if depth == 0:
+                level = self.filter(parent_message__isnull=True)
+            else:
+                # Only parents placed by the previous pass have a path and this depth.
+                level = self.filter(parent_message__thread_depth=depth - 1).exclude(
+                    parent_message__thread_path=""
+                )
+            level = level.select_related("parent_message").only(
+                "message_id", "parent_message", "parent_message__thread_path"
+            ).order_by("pk")
+            found = False
+            last_pk = None
+            while True:
+                page = level if last_pk is None else level.filter(pk__gt=last_pk)
+                chunk = list(page[:batch_size])
+                if not chunk:
+                    break
+                found = True
+                for message in chunk:
+                    parent_path = message.parent_message.thread_path if depth else ""
+                    message.thread_path = parent_path + message.path_segment()
+                    message.thread_depth = depth
+                self.bulk_update(chunk, ["thread_path", "thread_depth"])
+                last_pk = chunk[-1].pk
+            if not found:
+                return depth
+            depth += 1
+
+    def bulk_edit(self, messages, batch_size=500):
+        """
+        Save content edits for many messages at once: history rows go in
+        with one bulk_create and the edits with one bulk_update. Messages
+        whose content did not change are skipped. Bypasses save() signals.
+        """
+        history_model = self.model._meta.get_field("history").related_model
+        edited, history = [], []
+        for message in messages:
+            old_content = message.changed_fields().get("content")
+            if old_content is None:
+                continue
+            message.edited = True
+            edited.append(message)
+            history.append(history_model(message=message, old_content=old_content))
+
+        with transaction.atomic(using=self.db):
+            history_model.objects.bulk_create(history, batch_size=batch_size)
+            self.bulk_update(edited, ["content", "edited"], batch_size=batch_size)
+        for conversation_id in {message.conversation_id for message in edited}:
+            bump_conversation_version(conversation_id, using=self.db)
+        # Imported here: search imports the models, which import this module.
+        from .search import index_messages
+        index_messages(edited)
+        for message in edited:
+            message.snapshot_tracked_fields()
+        return len(edited)
+
+    def bulk_send(self, messages, batch_size=500):
+        """
+        Insert new messages with bulk_create, doing in bulk what save() and
+        the post_save receivers do one message at a time: thread paths,
+        notifications, unread counters, message list invalidation and
+        search indexing. Replies need ``parent_message`` set to a saved
+        message, or to one earlier in ``messages``.
+        """
+        notification_model = self.model._meta.get_field("notifications").related_model
+        # Imported here: these modules import the models, which import this module.
+        from .counters import adjust_unread_many
+        from .search import index_messages
+
+        messages = list(messages)
+        counts = {}
+        for message in messages:
+            message.set_thread_path()
+            key = (message.receiver_id, message.conversation_id)
+            counts[key] = counts.get(key, 0) + 1
+
+        with transaction.atomic(using=self.db):
+            self.bulk_create(messages, batch_size=batch_size)
+            notification_model.objects.bulk_create(
+                [notification_model(user_id=message.receiver_id, message=message) for message in messages],
+                batch_size=batch_size,
+            )
+            adjust_unread_many(counts)
+        for conversation_id in {message.conversation_id for message in messages}:
+            bump_conversation_version(conversation_id, using=self.db)
+        index_messages(messages)
+        for message in messages:
+            message.snapshot_tracked_fields()
+        return messages
+
+
+class UnreadMessagesManager(models.Manager.from_queryset(MessageQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().unread()
 
-class UnreadMessagesManager(models.Manager):
     def unread_for_user(self, user):
-        return self.get_queryset().filter(receiver=user, read=False)
+        return self.get_queryset().filter(receiver=user)
+
+
+class NotificationQuerySet(models.QuerySet):
+    def unread(self):
+        """Notifications not dismissed whose message is past the user's read watermark."""
+        read_state = apps.get_model("messaging", "ConversationReadState")
+        covered = read_state.objects.filter(
+            user=OuterRef("user"), conversation=OuterRef("message__conversation")
+        ).filter(
+            Q(last_read_at__gt=OuterRef("message__timestamp"))
+            | Q(last_read_at=OuterRef("message__timestamp"), last_read_id__gte=OuterRef("message__message_id"))
+        )
+        return self.filter(~Exists(covered), is_read=False)
+
+
+class ConversationQuerySet(models.QuerySet):
+    participant_fields = ("user_id", "username", "first_name", "last_name")
+
+    def with_inbox_summary(self, user):
+        """
+        Annotate each conversation with its latest message and ``user``'s
+        unread count, and prefetch a slim participant list, so a page of
+        the inbox costs two queries however many conversations or
+        participants it holds. Newest activity first.
+        """
+        message_model = self.model._meta.get_field("messages").related_model
+        user_model = self.model._meta.get_field("participants").related_model
+        counter_model = apps.get_model("messaging", "UnreadCounter")
+        latest = message_model.objects.filter(conversation=OuterRef("pk")).order_by("-timestamp", "-message_id")
+        unread = counter_model.objects.filter(user=user, conversation=OuterRef("pk")).values("count")[:1]
+        return (
+            self.annotate(
+                last_message_id=Subquery(latest.values("message_id")[:1], output_field=models.UUIDField()),
+                last_message_content=Subquery(latest.values("content")[:1]),
+                last_message_sender_id=Subquery(latest.values("sender_id")[:1], output_field=models.UUIDField()),
+                last_message_at=Subquery(latest.values("timestamp")[:1]),
+                unread_count=Coalesce(Subquery(unread), Value(0)),
+            )
+            .prefetch_related(
+                Prefetch("participants", queryset=user_model.objects.only(*self.participant_fields))
+            )
+            .order_by(F("last_message_at").desc(nulls_last=True), "-created_at")
+        )
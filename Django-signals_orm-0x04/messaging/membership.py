@@ -0,0 +1,74 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Conversation
+
+MEMBERSHIP_TTL = 60
+
+Participants = Conversation.participants.through
+
+
+def _cache_key(conversation_id, user_id):
+    return f"{Conversation._meta.app_label}:membership:{conversation_id}:{user_id}"
+
+
+def is_participant(user, conversation_id, request=None):
+    """
+    Whether ``user`` takes part in the conversation, answered from the
+    request's memo, then the shared cache, then one EXISTS query on the
+    participants join table. A malformed conversation id is no member's.
+    """
+    if user is None or not user.is_authenticated or conversation_id is None:
+        return False
+    try:
+        conversation_id = uuid.UUID(str(conversation_id))
+    except ValueError:
+        return False
+    memo = None
+    if request is not None:
+        memo = request.__dict__.setdefault("_conversation_membership", {})
+        if str(conversation_id) in memo:
+            return memo[str(conversation_id)]
+
+    key = _cache_key(conversation_id, user.pk)
+    member = cache.get(key)
+    if member is None:
+        member = Participants.objects.filter(conversation_id=conversation_id, user_id=user.pk).exists()
+        cache.set(key, member, MEMBERSHIP_TTL)
+
+    if memo is not None:
+        memo[str(conversation_id)] = member
+    return member
+
+
+def forget_membership(pairs, using=None):
+    """
+    Drop the cached answers for ``(conversation_id, user_id)`` pairs once
+    the current transaction commits, as bump_conversation_version does: a
+    request in between would cache the old answer for MEMBERSHIP_TTL.
+    """
+    keys = [_cache_key(conversation_id, user_id) for conversation_id, user_id in pairs]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys), using=using)
+
+
+def participants_changed(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    """m2m_changed receiver for Conversation.participants, from either side."""
+    if action == "pre_clear":
+        # pk_set is not given for clears; remember who is about to go.
+        if reverse:
+            instance._membership_cleared = set(instance.conversations.values_list("pk", flat=True))
+        else:
+            instance._membership_cleared = set(instance.participants.values_list("pk", flat=True))
+        return
+    if action == "post_clear":
+        pk_set = instance.__dict__.pop("_membership_cleared", set())
+    elif action not in ("post_add", "post_remove"):
+        return
+
+    if reverse:
+        forget_membership(((conversation_id, instance.pk) for conversation_id in pk_set), using=using)
+    else:
+        forget_membership(((instance.pk, user_id) for user_id in pk_set), using=using)
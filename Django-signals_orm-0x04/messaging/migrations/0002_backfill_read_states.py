@@ -0,0 +1,56 @@
+from django.db import migrations
+
+
+def backfill_read_states(apps, schema_editor):
+    """
+    Turn the per-message read flags into read watermarks. A watermark
+    covers everything up to it, so for each receiver and conversation it
+    is placed on the last read message before the oldest unread one:
+    nothing unread becomes read, though a message read out of order
+    after an unread one shows as unread again.
+    """
+    Message = apps.get_model("messaging", "Message")
+    ConversationReadState = apps.get_model("messaging", "ConversationReadState")
+    db = schema_editor.connection.alias
+
+    messages = (
+        Message.objects.using(db)
+        .order_by("receiver_id", "conversation_id", "timestamp", "message_id")
+        .values_list("receiver_id", "conversation_id", "timestamp", "message_id", "read")
+    )
+    states, scope, watermark, blocked = [], None, None, False
+
+    def flush():
+        if watermark is not None:
+            user_id, conversation_id = scope
+            states.append(ConversationReadState(
+                user_id=user_id, conversation_id=conversation_id,
+                last_read_at=watermark[0], last_read_id=watermark[1],
+            ))
+
+    for receiver_id, conversation_id, timestamp, message_id, read in messages.iterator(chunk_size=2000):
+        if (receiver_id, conversation_id) != scope:
+            flush()
+            scope, watermark, blocked = (receiver_id, conversation_id), None, False
+        if blocked:
+            continue
+        if read:
+            watermark = (timestamp, message_id)
+        else:
+            blocked = True
+        if len(states) >= 1000:
+            ConversationReadState.objects.using(db).bulk_create(states)
+            states = []
+    flush()
+    ConversationReadState.objects.using(db).bulk_create(states)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_read_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:32
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0002_backfill_read_states'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='message',
+            name='read',
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# The search side tables live outside the ORM (see messaging/search.py), so
+# they are created here per database vendor and filled from the messages
+# already stored. Other vendors search with an unindexed scan.
+FORWARD = {
+    "sqlite": [
+        "CREATE TABLE messaging_message_search_key ("
+        "id INTEGER PRIMARY KEY, message_id char(32) NOT NULL UNIQUE, conversation_id char(32) NOT NULL)",
+        "CREATE VIRTUAL TABLE messaging_message_search USING fts5(body, tokenize='unicode61')",
+        "INSERT INTO messaging_message_search_key (message_id, conversation_id) "
+        "SELECT message_id, conversation_id FROM messaging_message",
+        "INSERT INTO messaging_message_search (rowid, body) "
+        "SELECT k.id, m.content FROM messaging_message_search_key k "
+        "JOIN messaging_message m ON m.message_id = k.message_id",
+    ],
+    "postgresql": [
+        "CREATE TABLE messaging_message_search ("
+        "message_id uuid PRIMARY KEY, conversation_id uuid NOT NULL, document tsvector NOT NULL)",
+        "INSERT INTO messaging_message_search (message_id, conversation_id, document) "
+        "SELECT message_id, conversation_id, to_tsvector('english', content) FROM messaging_message",
+        "CREATE INDEX messaging_message_search_document ON messaging_message_search USING GIN (document)",
+        "CREATE INDEX messaging_message_search_conversation ON messaging_message_search (conversation_id)",
+    ],
+}
+
+BACKWARD = {
+    "sqlite": [
+        "DROP TABLE messaging_message_search",
+        "DROP TABLE messaging_message_search_key",
+    ],
+    "postgresql": [
+        "DROP TABLE messaging_message_search",
+    ],
+}
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_remove_message_read'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FORWARD), run(BACKWARD)),
+    ]
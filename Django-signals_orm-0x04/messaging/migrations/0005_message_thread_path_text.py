@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0004_message_search'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_thread_path_idx',
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='thread_path',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread_path'], name='message_thread_path_idx', opclasses=['text_pattern_ops']),
+        ),
+    ]
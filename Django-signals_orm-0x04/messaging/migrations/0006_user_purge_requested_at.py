@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0005_message_thread_path_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='purge_requested_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.db import models 
 import uuid
 from django.contrib.auth.models import AbstractUser
-from .managers import UnreadMessagesManager
+from django.core.exceptions import ValidationError
+from .managers import ConversationQuerySet, MessageManager, NotificationQuerySet, UnreadMessagesManager
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -17,50 +18,193 @@ class User(AbstractUser):
     phone_number = models.CharField(max_length=20, null=True, blank=True)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='guest')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the account is deleted; the row goes away when the purge of
+    # its data finishes, so any user still carrying it has a purge to resume.
+    purge_requested_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.email})"
 
-class Conversation:
+class Conversation(models.Model):
     conversation_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
     participants = models.ManyToManyField(User, related_name="conversations")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ConversationQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.participants} {self.created_at}"
 
-class Message:
+class Message(models.Model):
     message_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
     conversation = models.ForeignKey(Conversation, related_name="messages", on_delete=models.CASCADE)
     sender = models.ForeignKey(User, related_name="sent_messages", on_delete=models.CASCADE)
-    receiver = models.ForeignKey(User, related_name="received_messages", on_delete=models.CASCADE)
-    parent_message = models.ForeignKey("self", related_name="replies", null=True, blank=True, on_delete=models.CASCADE)
+    # receiver and parent_message lead composite indexes below, which
+    # serve their lookups, so they get no single-column index of their own.
+    receiver = models.ForeignKey(User, related_name="received_messages", on_delete=models.CASCADE, db_index=False)
+    parent_message = models.ForeignKey(
+        "self", related_name="replies", null=True, blank=True, on_delete=models.CASCADE, db_index=False
+    )
     content  = models.TextField()
     edited = models.BooleanField(default=False)
-    read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Materialized path of message ids from the thread root down to this
+    # message, e.g. "<root hex>/<reply hex>/". Set once, on first save.
+    thread_path = models.TextField(blank=True, default="", editable=False)
+    thread_depth = models.PositiveIntegerField(default=0, editable=False)
 
-    objects = models.Manager()
+    objects = MessageManager()
     unread = UnreadMessagesManager()
+
+    # Fields whose loaded value is remembered, so an edit can be diffed
+    # without reading the row again.
+    tracked_fields = ("content",)
+    # Each level adds 33 characters to thread_path; 64 levels keep the
+    # longest path well inside what a B-tree index entry can hold.
+    max_thread_depth = 64
+
+    class Meta:
+        indexes = [
+            # Message list pages, latest message per conversation.
+            models.Index(fields=["conversation", "-timestamp", "-message_id"], name="message_conv_ts_idx"),
+            # Unread messages for a receiver, compared against read watermarks;
+            # also serves the receiver foreign key.
+            models.Index(fields=["receiver", "conversation", "timestamp", "message_id"], name="message_receiver_conv_idx"),
+            # Direct replies in order; also serves the parent_message foreign key.
+            models.Index(fields=["parent_message", "timestamp"], name="message_parent_ts_idx"),
+            # Subtree prefix scans; text_pattern_ops lets PostgreSQL serve
+            # LIKE 'prefix%' from the index whatever the database collation.
+            models.Index(fields=["thread_path"], name="message_thread_path_idx", opclasses=["text_pattern_ops"]),
+        ]
  
     def __str__(self):
         return f"Message from({self.sender} to {self.receiver}): {self.content[:30]}"
 
     @property
     def is_reply(self):
-        return self.parent_message is not None
+        return self.parent_message_id is not None
+
+    def path_segment(self):
+        return f"{self.pk.hex}/"
+
+    def path_ids(self):
+        return [uuid.UUID(segment) for segment in self.thread_path.split("/") if segment]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.tracked_fields
+        }
+        return instance
+
+    def snapshot_tracked_fields(self):
+        # Reading a deferred field would load it with an extra query; it
+        # stays out of the snapshot, as it does in from_db().
+        deferred = self.get_deferred_fields()
+        self.loaded_values = {
+            name: getattr(self, name) for name in self.tracked_fields if name not in deferred
+        }
+
+    def changed_fields(self):
+        """Map of tracked field name to its loaded value, for fields that changed since."""
+        loaded = getattr(self, "loaded_values", {})
+        return {name: old for name, old in loaded.items() if getattr(self, name) != old}
+
+    def set_thread_path(self):
+        """
+        Derive thread_path and thread_depth from the parent message. A
+        parent saved before paths were tracked has its own path computed
+        and stored first, so the reply never starts a thread of its own.
+        """
+        parent = self.parent_message
+        if parent is None:
+            self.thread_path = self.path_segment()
+            self.thread_depth = 0
+            return
+        if not parent.thread_path:
+            parent.set_thread_path()
+            type(self).objects.filter(pk=parent.pk).update(
+                thread_path=parent.thread_path, thread_depth=parent.thread_depth
+            )
+        if parent.thread_depth >= self.max_thread_depth:
+            raise ValidationError(f"Replies cannot be nested more than {self.max_thread_depth} levels deep.")
+        self.thread_path = parent.thread_path + self.path_segment()
+        self.thread_depth = parent.thread_depth + 1
+
+    def save(self, *args, **kwargs):
+        if not self.thread_path:
+            self.set_thread_path()
+        super().save(*args, **kwargs)
+        self.snapshot_tracked_fields()
     
     
-class Notification:
+class Notification(models.Model):
     notification_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
     user = models.ForeignKey(User, related_name="notifications", on_delete=models.CASCADE)
     message = models.ForeignKey(Message, related_name="notifications", on_delete=models.CASCADE)
+    # Explicit dismissal only; reading the conversation past the message
+    # also makes the notification read (see NotificationQuerySet.unread).
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Only undismissed notifications are polled, so index just those.
+            models.Index(
+                fields=["user", "-created_at"], condition=models.Q(is_read=False), name="notification_unread_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Notification for {self.user} - {self.message}"
 
+class ConversationReadState(models.Model):
+    """
+    How far a user has read a conversation. Messages after the
+    (last_read_at, last_read_id) key are unread; everything up to it is read.
+    """
+    user = models.ForeignKey(User, related_name="read_states", on_delete=models.CASCADE)
+    conversation = models.ForeignKey(Conversation, related_name="read_states", on_delete=models.CASCADE)
+    last_read_at = models.DateTimeField()
+    last_read_id = models.UUIDField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "conversation"], name="read_state_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} read {self.conversation} up to {self.last_read_at}"
+
+    def covers(self, message):
+        return (self.last_read_at, self.last_read_id) >= (message.timestamp, message.pk)
+
+class UnreadCounter(models.Model):
+    """
+    Denormalized unread count for a user in one conversation. The row with
+    no conversation holds the user's total across all conversations.
+    """
+    user = models.ForeignKey(User, related_name="unread_counters", on_delete=models.CASCADE)
+    conversation = models.ForeignKey(
+        Conversation, related_name="unread_counters", null=True, blank=True, on_delete=models.CASCADE
+    )
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "conversation"], name="unread_counter_unique"),
+            models.UniqueConstraint(
+                fields=["user"], condition=models.Q(conversation__isnull=True), name="unread_counter_total_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} has {self.count} unread in {self.conversation or 'all conversations'}"
+
 class MessageHistory(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     message = models.ForeignKey(Message, related_name="history", on_delete=models.CASCADE)
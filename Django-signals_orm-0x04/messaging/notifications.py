@@ -0,0 +1,121 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MODE": "batched",
+    "BATCH_SIZE": 100,
+    "FLUSH_INTERVAL": 1.0,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "NOTIFICATIONS", {}).get(name, DEFAULTS[name])
+
+
+class NotificationBuffer:
+    """
+    Collects unsaved Notification rows and writes them with bulk_create.
+
+    Writes happen on a background thread, never on the thread calling
+    ``add()``: as soon as the buffer reaches ``batch_size`` rows, and every
+    ``flush_interval`` seconds otherwise. ``flush()`` writes the buffer at
+    once on the calling thread. Unless given, both limits are read from
+    settings.NOTIFICATIONS each time they are needed.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None):
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+
+    @property
+    def batch_size(self):
+        return self._batch_size if self._batch_size is not None else get_setting("BATCH_SIZE")
+
+    @property
+    def flush_interval(self):
+        return self._flush_interval if self._flush_interval is not None else get_setting("FLUSH_INTERVAL")
+
+    def add(self, notification):
+        with self._lock:
+            self._pending.append(notification)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="notification-buffer", daemon=True)
+                self._worker.start()
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+
+    def _take(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        return batch
+
+    def _write(self, batch):
+        try:
+            with transaction.atomic():
+                Notification.objects.bulk_create(batch, batch_size=self.batch_size)
+        except IntegrityError:
+            # One row whose message or user was deleted since it was queued
+            # fails the whole insert; keep the others by writing one by one.
+            dropped = 0
+            for notification in batch:
+                try:
+                    with transaction.atomic():
+                        notification.save(force_insert=True)
+                except IntegrityError:
+                    dropped += 1
+            logger.warning("Dropped %d of %d notifications: their message or user is gone", dropped, len(batch))
+
+    def flush(self):
+        batch = self._take()
+        if batch:
+            self._write(batch)
+        return len(batch)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            batch = self._take()
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Dropped %d notifications: writing the batch failed", len(batch))
+            finally:
+                # This thread opened its own connection; don't hold it between batches.
+                connections.close_all()
+
+    def __len__(self):
+        return len(self._pending)
+
+
+notification_buffer = NotificationBuffer()
+atexit.register(notification_buffer.flush)
+
+
+def enqueue_notification(notification):
+    """
+    Queue ``notification`` for writing once the surrounding transaction
+    commits. In "sync" mode it is saved right away instead.
+    """
+    if get_setting("MODE") == "sync":
+        notification.save()
+        return
+    transaction.on_commit(lambda: notification_buffer.add(notification))
+
+
+def flush_notifications():
+    return notification_buffer.flush()
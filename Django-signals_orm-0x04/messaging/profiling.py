@@ -0,0 +1,247 @@
+"""
+Per-request profiling: SQL query count and time, serialization time,
+total time and response size, aggregated per route.
+
+QueryProfilingMiddleware records one sample per request that resolved to a
+URL pattern, keyed by the pattern's view name, prefixed with the method
+for anything but GET, HEAD and OPTIONS ("POST conversation-messages-list"). The last ``SAMPLE_SIZE``
+samples of each route are kept in process memory; ``route_stats()``
+reports their p50/p95/p99. Every worker process keeps its own samples.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # None follows settings.DEBUG.
+    "ENABLED": None,
+    "SAMPLE_SIZE": 1000,
+    # Route key -> maximum queries per request, e.g. {"conversation-list": 4,
+    # "POST conversation-messages-list": 12}. Routes without one are not checked.
+    "QUERY_BUDGETS": {},
+}
+
+METRICS = ("queries", "db_ms", "serialize_ms", "total_ms", "bytes")
+PERCENTILES = (50, 95, 99)
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def get_setting(name):
+    return getattr(settings, "PROFILING", {}).get(name, DEFAULTS[name])
+
+
+def profiling_enabled():
+    enabled = get_setting("ENABLED")
+    return settings.DEBUG if enabled is None else enabled
+
+
+def query_budget(route):
+    return get_setting("QUERY_BUDGETS").get(route)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.started = time.perf_counter()
+        self._serializing = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper(); times every query.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def sample(self, response):
+        size = None if getattr(response, "streaming", False) else len(response.content)
+        return {
+            "queries": self.queries,
+            "db_ms": self.db_time * 1000,
+            "serialize_ms": self.serialize_time * 1000,
+            "total_ms": (time.perf_counter() - self.started) * 1000,
+            "bytes": size,
+        }
+
+
+_current = contextvars.ContextVar("messaging_request_profile", default=None)
+
+
+@contextmanager
+def serializing():
+    """
+    Count the enclosed block as serialization time for the current request.
+    Nested blocks are only counted once, by the outermost one.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    profile._serializing += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile._serializing -= 1
+        if not profile._serializing:
+            profile.serialize_time += time.perf_counter() - started
+
+
+class ProfiledSerializerMixin:
+    """Serializer mixin that reports ``to_representation`` time to the request profile."""
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[rank - 1]
+
+
+class ProfileStore:
+    def __init__(self, sample_size):
+        self.sample_size = sample_size
+        self._samples = defaultdict(lambda: deque(maxlen=self.sample_size))
+        self._lock = threading.Lock()
+
+    def record(self, route, sample):
+        with self._lock:
+            self._samples[route].append(sample)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def stats(self):
+        with self._lock:
+            snapshot = {route: list(samples) for route, samples in self._samples.items()}
+        report = {}
+        for route, samples in sorted(snapshot.items()):
+            entry = {"count": len(samples)}
+            for metric in METRICS:
+                values = sorted(sample[metric] for sample in samples if sample[metric] is not None)
+                if values:
+                    entry[metric] = {f"p{pct}": round(percentile(values, pct), 3) for pct in PERCENTILES}
+            entry["query_budget"] = query_budget(route)
+            report[route] = entry
+        return report
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProfileStore(get_setting("SAMPLE_SIZE"))
+    return _store
+
+
+def route_stats():
+    return get_store().stats()
+
+
+def reset_stats():
+    get_store().reset()
+
+
+def route_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    name = match.view_name or match.route
+    if request.method in SAFE_METHODS:
+        return name
+    return f"{request.method} {name}"
+
+
+class QueryProfilingMiddleware:
+    """
+    Profiles every request; the Server-Timing header is only added in
+    DEBUG or for staff users, since it tells clients how the server spends
+    its time. Requests over their route's query budget are logged as
+    warnings. The sample is also
+    left on ``response.profile`` for tests (see QueryBudgetTestMixin).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = profiling_enabled()
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        sample = profile.sample(response)
+        route = route_name(request)
+        if route is not None:
+            get_store().record(route, sample)
+            budget = query_budget(route)
+            if budget is not None and sample["queries"] > budget:
+                logger.warning("%s ran %d queries, over its budget of %d", route, sample["queries"], budget)
+        response.profile = {"route": route, **sample}
+        if settings.DEBUG or getattr(getattr(request, "user", None), "is_staff", False):
+            response["Server-Timing"] = (
+                f'db;dur={sample["db_ms"]:.3f};desc="{sample["queries"]} queries", '
+                f'ser;dur={sample["serialize_ms"]:.3f}, total;dur={sample["total_ms"]:.3f}'
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time it as serialization.
+        profile = _current.get()
+        if profile is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                profile.serialize_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin: ``assertWithinQueryBudget(response)`` fails when the
+    request behind ``response`` ran more queries than its route's budget
+    in settings.PROFILING, or than ``budget`` if one is given.
+    Requires QueryProfilingMiddleware.
+    """
+
+    def assertWithinQueryBudget(self, response, budget=None):
+        profile = getattr(response, "profile", None)
+        if profile is None:
+            self.fail("Response was not profiled; is QueryProfilingMiddleware installed?")
+        if budget is None:
+            budget = query_budget(profile["route"])
+        if budget is None:
+            self.fail(f"No query budget configured for {profile['route']}.")
+        self.assertLessEqual(
+            profile["queries"], budget, f"{profile['route']} ran {profile['queries']} queries, budget is {budget}"
+        )
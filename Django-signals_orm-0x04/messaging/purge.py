@@ -0,0 +1,146 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import bump_conversation_version
+from .counters import adjust_unread_many, unread_counts_for
+from .models import ConversationReadState, Message, MessageHistory, Notification, UnreadCounter, User
+from .search import remove_messages
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-purge")
+
+
+def _raw_delete(queryset):
+    # Plain DELETE ... WHERE, without Django collecting related rows in Python.
+    return queryset._raw_delete(queryset.db)
+
+
+class UserPurge:
+    """
+    Removes everything a user owns in set-based, chunked steps.
+
+    Each chunk runs in its own short transaction and every step re-selects
+    what is still left, so a purge that is interrupted can simply be run
+    again. ``progress`` is called as ``progress(step, rows)`` after each
+    chunk.
+    """
+
+    def __init__(self, user_id, chunk_size=1000, progress=None):
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.progress = progress or self.log_progress
+        self.totals = {}
+
+    def log_progress(self, step, rows):
+        logger.info("purge user %s: %s -%d (total %d)", self.user_id, step, rows, self.totals[step])
+
+    def report(self, step, rows):
+        self.totals[step] = self.totals.get(step, 0) + rows
+        self.progress(step, rows)
+
+    def run(self):
+        self.purge_notifications()
+        self.detach_edit_logs()
+        self.purge_messages()
+        self.delete_counters()
+        self.delete_user()
+        return self.totals
+
+    def purge_notifications(self):
+        queryset = Notification.objects.filter(user_id=self.user_id)
+        while True:
+            ids = list(queryset.values_list("pk", flat=True)[:self.chunk_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                rows = _raw_delete(Notification.objects.filter(pk__in=ids))
+            self.report("notifications", rows)
+
+    def detach_edit_logs(self):
+        rows = MessageHistory.objects.filter(edited_by_id=self.user_id).update(edited_by=None)
+        self.report("edit_logs", rows)
+
+    def purge_messages(self):
+        queryset = Message.objects.filter(
+            Q(sender_id=self.user_id) | Q(receiver_id=self.user_id)
+        ).order_by("-thread_depth")
+        while True:
+            ids = list(queryset.values_list("pk", flat=True)[:self.chunk_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                self.delete_messages(self.with_replies(ids))
+
+    def with_replies(self, ids):
+        """
+        ``ids`` plus every reply beneath them (replies cascade with their
+        parent), grouped by level with the deepest level first.
+        """
+        levels = [ids]
+        while levels[-1]:
+            levels.append(list(
+                Message.objects.filter(parent_message_id__in=levels[-1]).values_list("pk", flat=True)
+            ))
+        levels.pop()
+        return reversed(levels)
+
+    def delete_messages(self, levels):
+        for ids in levels:
+            # Raw deletes skip post_delete, so release other users' unread counts here.
+            adjust_unread_many(unread_counts_for(Message.objects.filter(pk__in=ids)), sign=-1)
+            conversation_ids = set(
+                Message.objects.filter(pk__in=ids).values_list("conversation_id", flat=True)
+            )
+            self.report("notifications", _raw_delete(Notification.objects.filter(message_id__in=ids)))
+            self.report("history", _raw_delete(MessageHistory.objects.filter(message_id__in=ids)))
+            self.report("messages", _raw_delete(Message.objects.filter(pk__in=ids)))
+            remove_messages(ids)
+            for conversation_id in conversation_ids:
+                bump_conversation_version(conversation_id)
+
+    def delete_counters(self):
+        self.report("unread_counters", _raw_delete(UnreadCounter.objects.filter(user_id=self.user_id)))
+        self.report("read_states", _raw_delete(ConversationReadState.objects.filter(user_id=self.user_id)))
+
+    def delete_user(self):
+        # Only join tables and small auth relations are left to collect.
+        rows, _ = User.objects.filter(pk=self.user_id).delete()
+        self.report("user", rows)
+
+
+def purge_user(user_id, chunk_size=1000, progress=None):
+    return UserPurge(user_id, chunk_size=chunk_size, progress=progress).run()
+
+
+def _purge_in_background(user_id, chunk_size):
+    try:
+        return purge_user(user_id, chunk_size=chunk_size)
+    except Exception:
+        logger.exception("purge user %s failed; run purge_user again to resume", user_id)
+        raise
+    finally:
+        connections.close_all()
+
+
+def enqueue_user_purge(user_id, chunk_size=1000):
+    """
+    Mark the user as pending purge, then run the purge on a background
+    worker once the current transaction commits. The mark outlives a
+    worker that dies mid-purge; ``pending_purges()`` finds it again.
+    """
+    User.objects.filter(pk=user_id).update(purge_requested_at=timezone.now())
+    transaction.on_commit(lambda: _executor.submit(_purge_in_background, user_id, chunk_size))
+
+
+def pending_purges():
+    """Ids of users whose purge was requested but has not finished, oldest request first."""
+    return list(
+        User.objects.filter(purge_requested_at__isnull=False)
+        .order_by("purge_requested_at")
+        .values_list("pk", flat=True)
+    )
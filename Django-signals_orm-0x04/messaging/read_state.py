@@ -0,0 +1,81 @@
+import uuid
+
+from django.db import transaction
+from django.db.models import Q
+
+from .counters import adjust_unread
+from .models import ConversationReadState, Message
+
+
+def latest_key(messages):
+    """The (timestamp, message_id) key of the newest message in ``messages``, or None."""
+    return messages.order_by("-timestamp", "-message_id").values_list("timestamp", "message_id").first()
+
+
+def is_unread(message):
+    state = ConversationReadState.objects.filter(
+        user_id=message.receiver_id, conversation_id=message.conversation_id
+    ).first()
+    return state is None or not state.covers(message)
+
+
+def advance_watermark(user, conversation, key):
+    """
+    Move ``user``'s read watermark in ``conversation`` forward to ``key``.
+    One row is written no matter how many messages that covers; the unread
+    counters drop by the number of the user's messages newly covered.
+    Watermarks never move backwards. Returns the number newly read.
+    """
+    timestamp, message_id = key
+    message_id = uuid.UUID(str(message_id))
+    covered = Message.objects.filter(conversation=conversation, receiver=user).filter(
+        Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, message_id__lte=message_id)
+    )
+    with transaction.atomic():
+        # get_or_create retries the read when a concurrent request inserts
+        # the row first (IntegrityError), and the row is locked either way.
+        state, created = ConversationReadState.objects.select_for_update().get_or_create(
+            user=user, conversation=conversation,
+            defaults={"last_read_at": timestamp, "last_read_id": message_id},
+        )
+        if created:
+            newly_read = covered.count()
+        else:
+            if (state.last_read_at, state.last_read_id) >= (timestamp, message_id):
+                return 0
+            newly_read = covered.filter(
+                Q(timestamp__gt=state.last_read_at)
+                | Q(timestamp=state.last_read_at, message_id__gt=state.last_read_id)
+            ).count()
+            state.last_read_at, state.last_read_id = timestamp, message_id
+            state.save(update_fields=["last_read_at", "last_read_id", "updated_at"])
+        adjust_unread(user.pk, conversation.pk, -newly_read)
+    return newly_read
+
+
+def mark_read(user, conversation, message_ids=None, up_to=None, up_to_key=None):
+    """
+    Mark ``user``'s messages in ``conversation`` read by advancing the read
+    watermark: to the newest of ``message_ids``, to the newest message sent
+    at or before ``up_to``, or to the newest message at or before the
+    ``(timestamp, message_id)`` key ``up_to_key`` taken from a pagination
+    cursor. Every limit is resolved to a stored message, so a tampered
+    cursor cannot put the watermark ahead of what has been sent. Returns
+    the number of messages newly read.
+    """
+    keys = []
+    messages = Message.objects.filter(conversation=conversation)
+    if message_ids is not None:
+        keys.append(latest_key(messages.filter(pk__in=message_ids)))
+    if up_to is not None:
+        keys.append(latest_key(messages.filter(timestamp__lte=up_to)))
+    if up_to_key is not None:
+        timestamp, message_id = up_to_key
+        keys.append(latest_key(messages.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, message_id__lte=message_id)
+        )))
+    keys = [key for key in keys if key is not None]
+    if not keys:
+        return 0
+    # Several limits narrow the watermark rather than widen it.
+    return advance_watermark(user, conversation, min(keys, key=lambda k: (k[0], uuid.UUID(str(k[1])))))
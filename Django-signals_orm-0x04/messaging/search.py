@@ -0,0 +1,258 @@
+"""
+Full-text search over message bodies.
+
+Messages are copied into a side table holding an inverted index: an FTS5
+virtual table on SQLite, a tsvector column with a GIN index on
+PostgreSQL. Other databases fall back to a LIKE scan. The tables are
+created, and filled, by migration 0004; they are kept current by the
+Message save/delete signals and can be rebuilt with ``rebuild_index()``.
+
+Results are restricted to the conversations the user takes part in,
+ranked best-first and paged with a (score, message_id) keyset cursor.
+"""
+import json
+import uuid
+from abc import ABC, abstractmethod
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Conversation, Message
+
+BODY_FIELD = "content"
+TABLE = f"{Message._meta.db_table}_search"
+# SQLite only: gives each message the integer rowid its FTS5 row is stored
+# under, so a message's row is found through this table's unique index.
+KEY_TABLE = f"{Message._meta.db_table}_search_key"
+
+Participants = Conversation.participants.through
+
+
+def _pk_value(value):
+    return Message._meta.pk.get_db_prep_value(Message._meta.pk.to_python(value), connection)
+
+
+def _conversation_value(value):
+    field = Conversation._meta.pk
+    return field.get_db_prep_value(field.to_python(value), connection)
+
+
+def _user_value(user):
+    field = Participants._meta.get_field("user").target_field
+    return field.get_db_prep_value(user.pk, connection)
+
+
+def _member_conversations_sql():
+    table = connection.ops.quote_name(Participants._meta.db_table)
+    conversation = Participants._meta.get_field("conversation").column
+    user = Participants._meta.get_field("user").column
+    return f"SELECT {conversation} FROM {table} WHERE {user} = %s"
+
+
+class BaseSearchBackend(ABC):
+    """Scores are ascending: lower is a better match."""
+
+    @abstractmethod
+    def index(self, messages):
+        """Add ``messages`` to the index, replacing any earlier copy."""
+
+    @abstractmethod
+    def remove(self, message_ids):
+        """Drop the given messages from the index."""
+
+    @abstractmethod
+    def search(self, user, query, limit, after=None):
+        """Return up to ``limit`` (score, message_id) pairs ranked after the ``after`` key."""
+
+    @abstractmethod
+    def filter(self, queryset, query):
+        """Narrow a Message queryset to the messages matching ``query``, keeping its order."""
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    @staticmethod
+    def match(query):
+        # Quote every term so user input is never parsed as FTS5 syntax.
+        return " ".join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+
+    def remove(self, message_ids):
+        rows = [(_pk_value(pk),) for pk in message_ids]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {TABLE} WHERE rowid = (SELECT id FROM {KEY_TABLE} WHERE message_id = %s)", rows
+            )
+            cursor.executemany(f"DELETE FROM {KEY_TABLE} WHERE message_id = %s", rows)
+
+    def index(self, messages):
+        rows = [
+            (getattr(message, BODY_FIELD), _pk_value(message.pk), _conversation_value(message.conversation_id))
+            for message in messages
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {KEY_TABLE} (message_id, conversation_id) VALUES (%s, %s) "
+                "ON CONFLICT (message_id) DO NOTHING",
+                [row[1:] for row in rows],
+            )
+            cursor.executemany(
+                f"DELETE FROM {TABLE} WHERE rowid = (SELECT id FROM {KEY_TABLE} WHERE message_id = %s)",
+                [row[1:2] for row in rows],
+            )
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, body) SELECT id, %s FROM {KEY_TABLE} WHERE message_id = %s",
+                [row[:2] for row in rows],
+            )
+
+    def search(self, user, query, limit, after=None):
+        match = self.match(query)
+        if not match:
+            return []
+        sql = (
+            f"SELECT score, message_id FROM ("
+            f"SELECT bm25({TABLE}) AS score, k.message_id AS message_id "
+            f"FROM {TABLE} JOIN {KEY_TABLE} k ON k.id = {TABLE}.rowid "
+            f"WHERE {TABLE} MATCH %s AND k.conversation_id IN ({_member_conversations_sql()})"
+            f") AS hits"
+        )
+        params = [match, _user_value(user)]
+        if after is not None:
+            sql += " WHERE score > %s OR (score = %s AND message_id > %s)"
+            params += [after[0], after[0], _pk_value(after[1])]
+        sql += " ORDER BY score, message_id LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def filter(self, queryset, query):
+        match = self.match(query)
+        if not match:
+            return queryset
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT k.message_id FROM {TABLE} JOIN {KEY_TABLE} k ON k.id = {TABLE}.rowid "
+            f"WHERE {TABLE} MATCH %s",
+            [match],
+        ))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    config = "english"
+
+    def remove(self, message_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE message_id = ANY(%s)", [list(message_ids)])
+
+    def index(self, messages):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (message_id, conversation_id, document) "
+                f"VALUES (%s, %s, to_tsvector('{self.config}', %s)) "
+                "ON CONFLICT (message_id) DO UPDATE SET document = EXCLUDED.document",
+                [(message.pk, message.conversation_id, getattr(message, BODY_FIELD)) for message in messages],
+            )
+
+    def search(self, user, query, limit, after=None):
+        sql = (
+            f"SELECT score, message_id FROM ("
+            f"SELECT -ts_rank(document, websearch_to_tsquery('{self.config}', %s)) AS score, message_id "
+            f"FROM {TABLE} WHERE document @@ websearch_to_tsquery('{self.config}', %s) "
+            f"AND conversation_id IN ({_member_conversations_sql()})"
+            f") AS hits"
+        )
+        params = [query, query, user.pk]
+        if after is not None:
+            sql += " WHERE score > %s OR (score = %s AND message_id > %s)"
+            params += [after[0], after[0], Message._meta.pk.to_python(after[1])]
+        sql += " ORDER BY score, message_id LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def filter(self, queryset, query):
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT message_id FROM {TABLE} WHERE document @@ websearch_to_tsquery('{self.config}', %s)",
+            [query],
+        ))
+
+
+class ScanSearchBackend(BaseSearchBackend):
+    """Unindexed fallback for databases without a full-text engine here."""
+
+    def index(self, messages):
+        pass
+
+    def remove(self, message_ids):
+        pass
+
+    def search(self, user, query, limit, after=None):
+        hits = self.filter(Message.objects.all(), query).filter(
+            conversation__in=Participants.objects.filter(user_id=user.pk).values("conversation_id"),
+        ).order_by("pk")
+        if after is not None:
+            hits = hits.filter(pk__gt=after[1])
+        return [(0.0, pk) for pk in hits.values_list("pk", flat=True)[:limit]]
+
+    def filter(self, queryset, query):
+        return queryset.filter(**{f"{BODY_FIELD}__icontains": query})
+
+
+BACKENDS = {
+    "sqlite": SQLiteFTSBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, ScanSearchBackend)()
+
+
+def index_messages(messages):
+    get_backend().index(messages)
+
+
+def remove_messages(message_ids):
+    get_backend().remove(message_ids)
+
+
+def rebuild_index(batch_size=1000):
+    backend = get_backend()
+    queryset = Message.objects.order_by("pk").only("pk", "conversation_id", BODY_FIELD)
+    last_pk, total = None, 0
+    while True:
+        batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            return total
+        backend.index(batch)
+        total += len(batch)
+        last_pk = batch[-1].pk
+
+
+def encode_cursor(score, message_id):
+    return urlsafe_b64encode(json.dumps([score, str(message_id)]).encode("ascii")).decode("ascii")
+
+
+def decode_cursor(token):
+    try:
+        score, message_id = json.loads(urlsafe_b64decode(token.encode("ascii")))
+        return float(score), uuid.UUID(str(message_id))
+    except (TypeError, ValueError):
+        raise ValueError(token)
+
+
+def search_messages(user, query, limit=20, cursor=None):
+    """
+    Return ``(messages, next_cursor)``: the best ``limit`` matches for
+    ``query`` in ``user``'s conversations after ``cursor``, best first.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    hits = get_backend().search(user, query, limit + 1, after=after)
+    page = hits[:limit]
+    found = Message.objects.select_related("sender").in_bulk([message_id for _, message_id in page])
+    messages = [
+        found[pk] for pk in (Message._meta.pk.to_python(message_id) for _, message_id in page) if pk in found
+    ]
+    next_cursor = encode_cursor(*page[-1]) if len(hits) > limit else None
+    return messages, next_cursor
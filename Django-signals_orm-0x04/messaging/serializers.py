@@ -1,30 +1,59 @@
 from rest_framework import serializers
 from .models import User, Message, Conversation
+from .profiling import ProfiledSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     full_name = serializers.CharField(source="get_full_name", read_only=True)
 
     class Meta:
         model = User
         fields = '__all__'
+        extra_kwargs = {'password': {'write_only': True}}
 
-class ConversationSerializer(serializers.ModelSerializer):
-    participants = UserSerializer(many=True, read_only=True)
-    messages = serializers.SerializerMethodField() 
+class ParticipantSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['user_id', 'username', 'first_name', 'last_name']
+
+class ConversationSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    participants = ParticipantSerializer(many=True, read_only=True)
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True, default=0)
 
     class Meta:
         model = Conversation
-        fields = '__all__'
+        fields = ['conversation_id', 'participants', 'created_at', 'last_message', 'unread_count']
 
-class MessageSerializer(serializers.ModelSerializer):
+    def get_last_message(self, obj):
+        # Filled in by ConversationQuerySet.with_inbox_summary(); no query here.
+        if getattr(obj, 'last_message_id', None) is None:
+            return None
+        return {
+            'message_id': obj.last_message_id,
+            'sender_id': obj.last_message_sender_id,
+            'content': obj.last_message_content,
+            'timestamp': obj.last_message_at,
+        }
+
+class MessageSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     sender_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
         fields = '__all__'
 
+    def get_sender_name(self, obj):
+        return obj.sender.username
+
     def validate(self, data):
         participants = self.initial_data.get("participants", [])
         if len(participants) < 2:
             raise serializers.ValidationError("A conversation must have at least 2 participants.")
-        return data
\ No newline at end of file
+        return data
+
+class BulkMessageItemSerializer(serializers.Serializer):
+    """One entry of a bulk send; membership is checked by the view for the whole batch."""
+    conversation = serializers.UUIDField()
+    receiver = serializers.UUIDField()
+    content = serializers.CharField()
+    parent_message = serializers.UUIDField(required=False, allow_null=True)
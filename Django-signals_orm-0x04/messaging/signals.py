@@ -1,34 +1,98 @@
-from django.db.models.signals import post_save, pre_save, post_delete
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Message, Notification, MessageHistory, User
+from .models import Conversation, Message, Notification, MessageHistory
+from .notifications import enqueue_notification
+from .counters import adjust_unread, adjust_unread_many, unread_counts_for
+from .read_state import is_unread
+from .cache import bump_conversation_version
+from .membership import Participants, participants_changed
+from .search import index_messages, remove_messages
 
 
 @receiver(post_save, sender=Message)
 def create_notification(sender, instance, created, **kwargs):
     if created:  
-        Notification.objects.create(
-            user=instance.receiver,
+        enqueue_notification(Notification(
+            user_id=instance.receiver_id,
             message=instance
-        )
+        ))
 
 @receiver(pre_save, sender=Message)
-def log_message_edit(sender, instance, **kwargs):
-    if instance.id:  
-        try:
-            old_message = Message.objects.get(id=instance.id)
-        except Message.DoesNotExist:
+def log_message_edit(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding:
+        return
+    if update_fields is not None and "content" not in update_fields:
+        return
+
+    if "content" in getattr(instance, "loaded_values", {}):
+        old_content = instance.changed_fields().get("content")
+    else:
+        # content was deferred when the row was loaded, so diff against the database.
+        old_content = (
+            Message.objects.filter(pk=instance.pk).values_list("content", flat=True).first()
+        )
+        if old_content == instance.content:
+            old_content = None
+
+    if old_content is not None:
+        MessageHistory.objects.create(
+            message=instance,
+            old_content=old_content
+        )
+        instance.edited = True
+
+
+@receiver(post_save, sender=Message)
+def update_unread_counter(sender, instance, created, **kwargs):
+    if created:
+        adjust_unread(instance.receiver_id, instance.conversation_id, 1)
+
+
+# Counters are released in pre_delete: by post_delete the read states of a
+# deleted conversation are gone, and every message in it would look unread.
+@receiver(pre_delete, sender=Conversation)
+def release_conversation_unread(sender, instance, **kwargs):
+    adjust_unread_many(unread_counts_for(Message.objects.filter(conversation=instance)), sign=-1)
+
+
+@receiver(pre_delete, sender=Message)
+def release_unread_counter(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, QuerySet):
+        origin_model = origin.model
+    else:
+        origin_model = type(origin)
+    if origin_model is Conversation:
+        return  # Released by release_conversation_unread.
+    if origin_model is Message and isinstance(origin, QuerySet):
+        # A queryset delete releases all its messages in one query, on the
+        # first of them; only replies deleted with them are left.
+        released = getattr(origin, "_released_unread", None)
+        if released is None:
+            messages = Message.objects.filter(pk__in=origin.values("pk"))
+            released = origin._released_unread = set(messages.values_list("pk", flat=True))
+            adjust_unread_many(unread_counts_for(messages), sign=-1)
+        if instance.pk in released:
             return
+    if is_unread(instance):
+        adjust_unread(instance.receiver_id, instance.conversation_id, -1)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def invalidate_message_list(sender, instance, **kwargs):
+    bump_conversation_version(instance.conversation_id)
+
+
+@receiver(post_save, sender=Message)
+def index_message(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "content" in update_fields:
+        index_messages([instance])
+
 
-        if old_message.content != instance.content:
-            MessageHistory.objects.create(
-                message=old_message,
-                old_content=old_message.content
-            )
-            instance.edited = True
+@receiver(post_delete, sender=Message)
+def unindex_message(sender, instance, **kwargs):
+    remove_messages([instance.pk])
 
 
-@receiver(post_delete, sender=User)
-def cleanup_user_data(sender, instance, **kwargs):
-    Message.objects.filter(sender=instance).delete()
-    Message.objects.filter(receiver=instance).delete()
-    Notification.objects.filter(user=instance).delete()
\ No newline at end of file
+m2m_changed.connect(participants_changed, sender=Participants, dispatch_uid="messaging_participants_changed")
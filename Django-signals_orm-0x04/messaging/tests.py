@@ -1,3 +1,687 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import time
+import uuid
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .cache import bump_conversation_version, conversation_version
+from .counters import unread_count
+from .membership import is_participant
+from .models import Conversation, ConversationReadState, Message, Notification, User
+from .notifications import NotificationBuffer
+from .profiling import QueryBudgetTestMixin
+from .purge import enqueue_user_purge, pending_purges
+from .read_state import mark_read
+from .search import KEY_TABLE, TABLE, search_messages
+from .views import MessageViewSet
+
+
+def make_users(count):
+    """Create ``count`` users named user0, user1, ... in one query."""
+    return User.objects.bulk_create(
+        User(username=f"user{i}", email=f"user{i}@example.com", first_name="User", last_name=str(i))
+        for i in range(count)
+    )
+
+
+class QueryPlanTests(TestCase):
+    """
+    Guards the hot queries against regressions to full table scans. The
+    tables are seeded with enough rows, and statistics, that the planner
+    would rather scan than use a poorly matching index, then each query's
+    EXPLAIN output is checked for the index meant to serve it.
+    """
+
+    users_count = 20
+    conversations_count = 10
+    messages_per_conversation = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = make_users(cls.users_count)
+        cls.conversations = Conversation.objects.bulk_create(
+            Conversation() for _ in range(cls.conversations_count)
+        )
+        messages = []
+        for c, conversation in enumerate(cls.conversations):
+            sender, receiver = cls.users[c % cls.users_count], cls.users[(c + 1) % cls.users_count]
+            conversation.participants.add(sender, receiver)
+            for i in range(cls.messages_per_conversation):
+                # Every third message starts a thread; the others reply to the one before.
+                parent = messages[-1] if i % 3 else None
+                messages.append(Message(
+                    conversation=conversation,
+                    sender=sender if i % 2 else receiver,
+                    receiver=receiver if i % 2 else sender,
+                    parent_message=parent,
+                    content=f"message {i}",
+                ))
+        Message.objects.bulk_create(messages)
+        Message.objects.rebuild_paths()
+        Notification.objects.bulk_create(
+            Notification(user=message.receiver, message=message, is_read=i % 5 != 0)
+            for i, message in enumerate(messages)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.user = cls.users[0]
+        cls.conversation = cls.conversations[0]
+
+    def explain(self, queryset):
+        if connection.vendor == "postgresql":
+            # Test tables are small enough that a sequential scan always wins.
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = self.explain(queryset)
+        self.assertIn(index_name, plan, f"{index_name} not used:\n{plan}")
+
+    def test_message_list_page(self):
+        queryset = Message.objects.filter(conversation=self.conversation).order_by("-timestamp", "-message_id")
+        self.assertUsesIndex(queryset[:20], "message_conv_ts_idx")
+
+    def test_unread_messages_for_receiver(self):
+        self.assertUsesIndex(Message.unread.unread_for_user(self.user), "message_receiver_conv_idx")
+
+    def test_direct_replies(self):
+        roots = Message.objects.filter(conversation=self.conversation, parent_message__isnull=True)
+        queryset = Message.objects.filter(parent_message__in=list(roots[:5])).order_by("timestamp")
+        self.assertUsesIndex(queryset, "message_parent_ts_idx")
+
+    def test_thread_subtree(self):
+        root = Message.objects.filter(conversation=self.conversation, parent_message__isnull=True).first()
+        self.assertUsesIndex(Message.objects.subtree(root), "message_thread_path_idx")
+
+    def test_unread_notifications(self):
+        queryset = Notification.objects.filter(user=self.user, is_read=False).order_by("-created_at")
+        self.assertUsesIndex(queryset, "notification_unread_idx")
+
+
+class ThreadPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender, cls.receiver = make_users(2)
+        cls.conversation = Conversation.objects.create()
+
+    def reply(self, parent=None):
+        return Message.objects.create(
+            conversation=self.conversation, sender=self.sender, receiver=self.receiver,
+            parent_message=parent, content="hello",
+        )
+
+    def test_reply_to_untracked_parent_extends_its_thread(self):
+        root = self.reply()
+        child = self.reply(root)
+        Message.objects.update(thread_path="", thread_depth=0)
+        child.refresh_from_db()
+        grandchild = self.reply(child)
+        self.assertEqual(grandchild.thread_path, root.thread_path + child.path_segment() + grandchild.path_segment())
+        self.assertEqual(grandchild.thread_depth, 2)
+        child.refresh_from_db()
+        self.assertEqual(child.thread_depth, 1)
+        self.assertEqual(list(Message.objects.subtree(root).order_by("thread_depth")), [root, child, grandchild])
+
+    def test_nesting_is_capped(self):
+        message = self.reply()
+        for _ in range(Message.max_thread_depth):
+            message = self.reply(message)
+        with self.assertRaises(ValidationError):
+            self.reply(message)
+
+    def test_rebuild_paths_in_chunks(self):
+        root = self.reply()
+        children = [self.reply(root) for _ in range(3)]
+        leaf = self.reply(children[-1])
+        expected = {message.pk: (message.thread_path, message.thread_depth) for message in [root, *children, leaf]}
+        Message.objects.update(thread_path="", thread_depth=0)
+        self.assertEqual(Message.objects.rebuild_paths(batch_size=2), 3)
+        self.assertEqual(
+            {pk: (path, depth) for pk, path, depth in Message.objects.values_list("pk", "thread_path", "thread_depth")},
+            expected,
+        )
+
+
+@override_settings(ROOT_URLCONF="messaging.urls")
+class MessageCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender, cls.receiver, cls.outsider = make_users(3)
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.add(cls.sender, cls.receiver)
+
+    def setUp(self):
+        self.client.force_login(self.sender)
+
+    def item(self, **data):
+        return {"conversation": str(self.conversation.pk), "receiver": str(self.receiver.pk), "content": "hi", **data}
+
+    def send_bulk(self, items):
+        url = reverse("conversation-messages-bulk", kwargs={"conversation_pk": self.conversation.pk})
+        return self.client.post(url, items, content_type="application/json")
+
+    def send(self, **data):
+        url = reverse("conversation-messages-list", kwargs={"conversation_pk": self.conversation.pk})
+        payload = {"conversation": str(self.conversation.pk), "receiver": str(self.receiver.pk), "content": "hi"}
+        return self.client.post(url, {**payload, **data}, content_type="application/json")
+
+    def test_create_reply(self):
+        parent = self.send().json()
+        response = self.send(parent_message=parent["message_id"])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["sender_name"], self.sender.username)
+        self.assertEqual(Message.objects.get(pk=response.json()["message_id"]).thread_depth, 1)
+
+    def test_reply_beyond_max_depth_is_rejected(self):
+        parent = Message.objects.create(
+            conversation=self.conversation, sender=self.receiver, receiver=self.sender, content="deep"
+        )
+        Message.objects.filter(pk=parent.pk).update(thread_depth=Message.max_thread_depth)
+        response = self.send(parent_message=str(parent.pk))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Message.objects.filter(parent_message=parent).exists())
+
+    def test_malformed_receiver_is_rejected(self):
+        self.assertEqual(self.send(receiver="not-an-id").status_code, 400)
+
+    def test_malformed_conversation_is_rejected(self):
+        self.assertEqual(self.send(conversation="nope").status_code, 400)
+
+    def test_bulk_is_capped(self):
+        with mock.patch.object(MessageViewSet, "bulk_max_items", 2):
+            response = self.send_bulk([self.item() for _ in range(3)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Message.objects.exists())
+
+    def test_bulk_sends_the_valid_items_and_reports_the_rest(self):
+        response = self.send_bulk([
+            self.item(),
+            self.item(receiver="not-an-id"),
+            self.item(receiver=str(self.outsider.pk)),
+            self.item(content="second"),
+        ])
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual([entry["index"] for entry in data["created"]], [0, 3])
+        self.assertEqual([entry["index"] for entry in data["errors"]], [1, 2])
+        self.assertIn("receiver", data["errors"][0]["errors"])
+        self.assertEqual(Message.objects.filter(conversation=self.conversation).count(), 2)
+
+    def test_bulk_from_a_non_participant_sends_nothing(self):
+        self.client.force_login(self.outsider)
+        response = self.send_bulk({"messages": [self.item(), self.item()]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["errors"][0]["errors"]["non_field_errors"],
+            ["You are not a participant of this conversation."],
+        )
+        self.assertFalse(Message.objects.exists())
+
+
+class MessageEditTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sender, receiver = make_users(2)
+        cls.message = Message.objects.create(
+            conversation=Conversation.objects.create(), sender=sender, receiver=receiver, content="hello"
+        )
+
+    def test_saving_with_deferred_content_does_not_load_it(self):
+        message = Message.objects.defer("content").get(pk=self.message.pk)
+        with self.assertNumQueries(1):
+            message.save(update_fields=["edited"])
+        self.assertIn("content", message.get_deferred_fields())
+
+
+@override_settings(ROOT_URLCONF="messaging.urls")
+class ThreadedMessagesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, other = make_users(2)
+        conversation = Conversation.objects.create()
+        conversation.participants.add(cls.user, other)
+        cls.roots = []
+        for i in range(3):
+            root = Message.objects.create(conversation=conversation, sender=other, receiver=cls.user, content=str(i))
+            reply = Message.objects.create(
+                conversation=conversation, sender=cls.user, receiver=other, parent_message=root, content="re"
+            )
+            Message.objects.create(
+                conversation=conversation, sender=other, receiver=cls.user, parent_message=reply, content="re re"
+            )
+            cls.roots.append(root)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_pages_roots_and_loads_only_their_threads(self):
+        response = self.client.get(reverse("message-threads"), {"limit": 2, "offset": 1})
+        data = response.json()
+        self.assertEqual(data["count"], 3)
+        self.assertEqual([thread["id"] for thread in data["results"]], [str(root.pk) for root in self.roots[1:]])
+        self.assertEqual(data["results"][0]["replies"][0]["replies"][0]["content"], "re re")
+
+    def test_depth_cut_reports_more_replies(self):
+        response = self.client.get(reverse("message-threads"), {"root": self.roots[0].pk, "depth": 1})
+        [thread] = response.json()["results"]
+        [reply] = thread["replies"]
+        self.assertEqual(reply["replies"], [])
+        self.assertTrue(reply["has_more_replies"])
+
+    def test_malformed_ids_are_bad_requests(self):
+        for params in ({"conversation_id": "nope"}, {"root": "nope"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse("message-threads"), params).status_code, 400)
+
+
+@override_settings(ROOT_URLCONF="messaging.urls", PROFILING={**settings.PROFILING, "ENABLED": True})
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Each route must stay within its query budget in settings.PROFILING, however much data it returns."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = make_users(2)
+        for _ in range(5):
+            conversation = Conversation.objects.create()
+            conversation.participants.add(cls.user, cls.other)
+            Message.objects.bulk_create(
+                Message(conversation=conversation, sender=cls.other, receiver=cls.user, content=f"message {i}")
+                for i in range(10)
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_conversation_list(self):
+        self.assertWithinQueryBudget(self.client.get(reverse("conversation-list")))
+
+    def test_unread_messages(self):
+        self.assertWithinQueryBudget(self.client.get(reverse("unread-messages")))
+
+    def test_unread_count(self):
+        self.assertWithinQueryBudget(self.client.get(reverse("unread-count")))
+
+    def test_writes_are_profiled_apart_from_reads(self):
+        conversation = Conversation.objects.filter(participants=self.user).first()
+        url = reverse("conversation-messages-list", kwargs={"conversation_pk": conversation.pk})
+        payload = {"conversation": str(conversation.pk), "receiver": str(self.other.pk), "content": "hi"}
+        with self.assertNoLogs("messaging.profiling", level="WARNING"):
+            response = self.client.post(url, payload, content_type="application/json")
+        self.assertEqual(response.profile["route"], "POST conversation-messages-list")
+
+    def test_server_timing_only_for_staff(self):
+        self.assertNotIn("Server-Timing", self.client.get(reverse("unread-count")))
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.assertIn("Server-Timing", self.client.get(reverse("unread-count")))
+
+
+class InboxSummaryTests(TestCase):
+    def test_last_message_ids_are_uuids(self):
+        sender, receiver = make_users(2)
+        conversation = Conversation.objects.create()
+        conversation.participants.add(sender, receiver)
+        message = Message.objects.create(conversation=conversation, sender=sender, receiver=receiver, content="hi")
+
+        summary = Conversation.objects.with_inbox_summary(receiver).get()
+        self.assertEqual(summary.last_message_id, message.pk)
+        self.assertEqual(summary.last_message_sender_id, sender.pk)
+
+
+@override_settings(ROOT_URLCONF="messaging.urls")
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, other = make_users(2)
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.add(cls.user, other)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_page(self, payload):
+        token = urlsafe_b64encode(json.dumps(payload).encode("ascii")).decode("ascii")
+        url = reverse("conversation-messages-list", kwargs={"conversation_pk": self.conversation.pk})
+        return self.client.get(url, {"cursor": token})
+
+    def test_malformed_cursor_is_not_found(self):
+        self.assertEqual(self.get_page(["not", "a cursor"]).status_code, 404)
+
+    def test_cursor_with_invalid_message_id_is_not_found(self):
+        self.assertEqual(self.get_page([0, "2024-01-01T00:00:00+00:00", "not-a-uuid"]).status_code, 404)
+
+
+class ReadStateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender, cls.receiver = make_users(2)
+        cls.conversation = Conversation.objects.create()
+        cls.messages = [
+            Message.objects.create(
+                conversation=cls.conversation, sender=cls.sender, receiver=cls.receiver, content=f"message {i}"
+            )
+            for i in range(4)
+        ]
+
+    def test_watermark_only_moves_forward(self):
+        self.assertEqual(mark_read(self.receiver, self.conversation, message_ids=[self.messages[1].pk]), 2)
+        self.assertEqual(mark_read(self.receiver, self.conversation, message_ids=[self.messages[0].pk]), 0)
+        self.assertEqual(mark_read(self.receiver, self.conversation, message_ids=[self.messages[3].pk]), 2)
+        self.assertEqual(ConversationReadState.objects.filter(user=self.receiver).count(), 1)
+        self.assertEqual(unread_count(self.receiver, self.conversation.pk), 0)
+
+    def test_cursor_key_ahead_of_the_messages_stops_at_the_newest(self):
+        future = self.messages[-1].timestamp + timedelta(days=1)
+        self.assertEqual(mark_read(self.receiver, self.conversation, up_to_key=(future, uuid.uuid4())), 4)
+        state = ConversationReadState.objects.get(user=self.receiver, conversation=self.conversation)
+        self.assertEqual((state.last_read_at, state.last_read_id), (self.messages[-1].timestamp, self.messages[-1].pk))
+
+        Message.objects.create(conversation=self.conversation, sender=self.sender, receiver=self.receiver, content="new")
+        self.assertEqual(unread_count(self.receiver, self.conversation.pk), 1)
+        self.assertEqual(Message.unread.unread_for_user(self.receiver).count(), 1)
+
+    def test_deleting_a_partly_read_conversation_releases_its_unread(self):
+        other = Conversation.objects.create()
+        Message.objects.create(conversation=other, sender=self.sender, receiver=self.receiver, content="elsewhere")
+        mark_read(self.receiver, self.conversation, message_ids=[self.messages[1].pk])
+        self.assertEqual(unread_count(self.receiver), 3)
+
+        self.conversation.delete()
+        self.assertEqual(unread_count(self.receiver), 1)
+
+    def test_queryset_delete_releases_unread_once(self):
+        reply = Message.objects.create(
+            conversation=self.conversation, sender=self.sender, receiver=self.receiver,
+            parent_message=self.messages[0], content="reply",
+        )
+        mark_read(self.receiver, self.conversation, message_ids=[self.messages[0].pk])
+        self.assertEqual(unread_count(self.receiver), 4)
+
+        # messages[0] is read; its reply goes with it through the cascade.
+        Message.objects.filter(pk__in=[self.messages[0].pk, self.messages[2].pk]).delete()
+        self.assertFalse(Message.objects.filter(pk=reply.pk).exists())
+        self.assertEqual(unread_count(self.receiver), 2)
+        self.assertEqual(unread_count(self.receiver, self.conversation.pk), 2)
+
+    @override_settings(ROOT_URLCONF="messaging.urls")
+    def test_mark_read_rejects_bad_input(self):
+        self.conversation.participants.add(self.sender, self.receiver)
+        self.client.force_login(self.receiver)
+        url = reverse("conversation-mark-read", kwargs={"pk": self.conversation.pk})
+        for payload in ({"message_ids": ["not-a-uuid"]}, {"message_ids": 5}, {"up_to": "2024-13-45T25:00:00"}):
+            with self.subTest(payload=payload):
+                response = self.client.post(url, payload, content_type="application/json")
+                self.assertEqual(response.status_code, 400)
+
+
+class UnreadCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender, cls.receiver = make_users(2)
+        cls.first, cls.second = Conversation.objects.create(), Conversation.objects.create()
+        for conversation in (cls.first, cls.second):
+            conversation.participants.add(cls.sender, cls.receiver)
+
+    def send(self, conversation, count=1):
+        return [
+            Message.objects.create(conversation=conversation, sender=self.sender, receiver=self.receiver, content="hi")
+            for _ in range(count)
+        ]
+
+    def test_create_increments_conversation_and_total(self):
+        self.send(self.first, 2)
+        self.send(self.second)
+        self.assertEqual(unread_count(self.receiver, self.first.pk), 2)
+        self.assertEqual(unread_count(self.receiver, self.second.pk), 1)
+        self.assertEqual(unread_count(self.receiver), 3)
+        self.assertEqual(unread_count(self.sender), 0)
+
+    def test_mark_read_decrements(self):
+        messages = self.send(self.first, 3)
+        self.send(self.second)
+        mark_read(self.receiver, self.first, message_ids=[messages[1].pk])
+        self.assertEqual(unread_count(self.receiver, self.first.pk), 1)
+        self.assertEqual(unread_count(self.receiver, self.second.pk), 1)
+        self.assertEqual(unread_count(self.receiver), 2)
+
+    @override_settings(ROOT_URLCONF="messaging.urls")
+    def test_unread_count_view(self):
+        self.send(self.first, 2)
+        self.send(self.second)
+        self.client.force_login(self.receiver)
+        url = reverse("unread-count")
+        self.assertEqual(self.client.get(url).json()["unread"], 3)
+        self.assertEqual(self.client.get(url, {"conversation_id": self.first.pk}).json()["unread"], 2)
+        self.assertEqual(self.client.get(url, {"conversation_id": "nope"}).status_code, 400)
+
+
+class ReadFlagBackfillTests(TransactionTestCase):
+    migrate_from = [("messaging", "0001_initial")]
+    migrate_to = [("messaging", "0002_backfill_read_states")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(self.migrate_to)
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_watermark_stops_before_first_unread_message(self):
+        apps = self.migrate(self.migrate_from)
+        user_model = apps.get_model("messaging", "User")
+        message_model = apps.get_model("messaging", "Message")
+        sender, receiver = (
+            user_model.objects.create(username=f"user{i}", email=f"user{i}@example.com") for i in range(2)
+        )
+        conversation = apps.get_model("messaging", "Conversation").objects.create()
+        messages = [
+            message_model.objects.create(
+                conversation=conversation, sender=sender, receiver=receiver, content=str(i), read=read
+            )
+            for i, read in enumerate([True, True, False, True])
+        ]
+
+        apps = self.migrate(self.migrate_to)
+        state = apps.get_model("messaging", "ConversationReadState").objects.get()
+        self.assertEqual(state.user_id, receiver.pk)
+        self.assertEqual((state.last_read_at, state.last_read_id), (messages[1].timestamp, messages[1].pk))
+
+
+@override_settings(ROOT_URLCONF="messaging.urls")
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, other, cls.outsider = make_users(3)
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.add(cls.user, other)
+        cls.lunch = Message.objects.create(
+            conversation=cls.conversation, sender=other, receiver=cls.user, content="lunch at noon?"
+        )
+        Message.objects.create(conversation=cls.conversation, sender=other, receiver=cls.user, content="see you")
+
+    def test_search_is_scoped_to_participants(self):
+        self.assertEqual(search_messages(self.user, "lunch")[0], [self.lunch])
+        self.assertEqual(search_messages(self.outsider, "lunch")[0], [])
+
+    def test_edits_and_deletes_update_the_index(self):
+        self.lunch.content = "dinner at eight?"
+        self.lunch.save()
+        self.assertEqual(search_messages(self.user, "lunch")[0], [])
+        self.assertEqual(search_messages(self.user, "dinner")[0], [self.lunch])
+        self.lunch.delete()
+        self.assertEqual(search_messages(self.user, "dinner")[0], [])
+
+    def test_list_search_param_uses_the_index(self):
+        self.client.force_login(self.user)
+        url = reverse("conversation-messages-list", kwargs={"conversation_pk": self.conversation.pk})
+        response = self.client.get(url, {"conversation_id": self.conversation.pk, "search": "lunch"})
+        self.assertEqual([row["message_id"] for row in response.json()["results"]], [str(self.lunch.pk)])
+
+    def test_sqlite_removal_deletes_by_rowid(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("FTS5 backend only")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"EXPLAIN QUERY PLAN DELETE FROM {TABLE} WHERE rowid = "
+                f"(SELECT id FROM {KEY_TABLE} WHERE message_id = %s)",
+                [self.lunch.pk.hex],
+            )
+            plan = "\n".join(row[-1] for row in cursor.fetchall())
+        # FTS5 reports a rowid lookup as index "=", and a full scan without one.
+        self.assertIn(f"{TABLE} VIRTUAL TABLE INDEX 0:=", plan)
+        self.assertIn(f"SEARCH {KEY_TABLE} USING COVERING INDEX", plan)
+
+
+class NotificationBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender, cls.receiver = make_users(2)
+        cls.conversation = Conversation.objects.create()
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("timed out")
+            time.sleep(0.01)
+
+    def test_notifications_are_buffered_on_commit(self):
+        buffer = NotificationBuffer(batch_size=100, flush_interval=60)
+        with mock.patch("messaging.notifications.notification_buffer", buffer):
+            with self.captureOnCommitCallbacks() as callbacks:
+                Message.objects.create(
+                    conversation=self.conversation, sender=self.sender, receiver=self.receiver, content="hi"
+                )
+            self.assertEqual(len(buffer), 0)
+            for callback in callbacks:
+                callback()
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(Notification.objects.filter(user=self.receiver).count(), 1)
+
+    @override_settings(NOTIFICATIONS={"BATCH_SIZE": 2, "FLUSH_INTERVAL": 60})
+    def test_full_batch_is_written_off_the_request_thread(self):
+        buffer = NotificationBuffer()
+        writers = []
+        with mock.patch.object(buffer, "_write", side_effect=lambda batch: writers.append(threading.current_thread())):
+            buffer.add(Notification(user=self.receiver))
+            self.assertEqual(writers, [])
+            buffer.add(Notification(user=self.receiver))
+            self.wait_for(lambda: writers)
+        self.assertIsNot(writers[0], threading.current_thread())
+
+    def test_failed_write_is_logged(self):
+        buffer = NotificationBuffer(batch_size=1, flush_interval=60)
+        with mock.patch.object(buffer, "_write", side_effect=RuntimeError("database is down")):
+            with self.assertLogs("messaging.notifications", "ERROR") as logs:
+                buffer.add(Notification(user=self.receiver))
+                self.wait_for(lambda: logs.records)
+        self.assertIn("Dropped 1 notifications", logs.output[0])
+
+
+# Sync mode keeps the messages' own notifications out of the shared buffer,
+# which would otherwise be flushed at exit, after the test database is gone.
+@override_settings(NOTIFICATIONS={"MODE": "sync"})
+class NotificationBufferWriteTests(TransactionTestCase):
+    def test_rows_for_deleted_messages_are_dropped_alone(self):
+        sender, receiver = make_users(2)
+        conversation = Conversation.objects.create()
+        kept, gone = (
+            Message.objects.create(conversation=conversation, sender=sender, receiver=receiver, content=str(i))
+            for i in range(2)
+        )
+        Message.objects.filter(pk=gone.pk).delete()
+        Notification.objects.all().delete()
+        buffer = NotificationBuffer(batch_size=10, flush_interval=60)
+        for message in (kept, gone, kept):
+            buffer.add(Notification(user=receiver, message=message))
+        with self.assertLogs("messaging.notifications", "WARNING") as logs:
+            self.assertEqual(buffer.flush(), 3)
+        self.assertIn("Dropped 1 of 3 notifications", logs.output[0])
+        self.assertEqual(Notification.objects.filter(message=kept).count(), 2)
+
+
+class UserPurgeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = make_users(2)
+        conversation = Conversation.objects.create()
+        Message.objects.create(conversation=conversation, sender=cls.user, receiver=cls.other, content="bye")
+
+    def test_unfinished_purge_is_resumed(self):
+        # The background run never happens: the callbacks are captured, not executed.
+        with self.captureOnCommitCallbacks():
+            enqueue_user_purge(self.user.pk)
+        self.assertEqual(pending_purges(), [self.user.pk])
+
+        call_command("purge_user", "--pending", stdout=io.StringIO())
+        self.assertEqual(pending_purges(), [])
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Message.objects.filter(sender=self.user).exists())
+
+
+class MessageListCacheTests(TestCase):
+    def test_version_is_bumped_only_on_commit(self):
+        conversation = Conversation.objects.create()
+        version = conversation_version(conversation.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_conversation_version(conversation.pk)
+            self.assertEqual(conversation_version(conversation.pk), version)
+        self.assertEqual(conversation_version(conversation.pk), version + 1)
+
+
+class MembershipCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = make_users(2)
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.add(cls.user, cls.other)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_answer_is_cached(self):
+        self.assertTrue(is_participant(self.user, self.conversation.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_participant(self.user, str(self.conversation.pk)))
+
+    def test_malformed_conversation_id_is_not_a_member(self):
+        with self.assertNumQueries(0):
+            self.assertFalse(is_participant(self.user, "nope"))
+
+    def test_removal_is_forgotten_on_commit(self):
+        self.assertTrue(is_participant(self.user, self.conversation.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.participants.remove(self.user)
+            self.assertTrue(is_participant(self.user, self.conversation.pk))
+        self.assertFalse(is_participant(self.user, self.conversation.pk))
+
+    def test_changes_from_the_user_side_are_forgotten(self):
+        self.assertTrue(is_participant(self.other, self.conversation.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.conversations.clear()
+        self.assertFalse(is_participant(self.other, self.conversation.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.conversations.add(self.conversation)
+        self.assertTrue(is_participant(self.other, self.conversation.pk))
+
+    @override_settings(ROOT_URLCONF="messaging.urls")
+    def test_message_list_with_malformed_conversation_id(self):
+        self.client.force_login(self.user)
+        url = reverse("conversation-messages-list", kwargs={"conversation_pk": self.conversation.pk})
+        self.assertEqual(self.client.get(url, {"conversation_id": "nope"}).status_code, 403)
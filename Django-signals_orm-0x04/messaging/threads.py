@@ -0,0 +1,64 @@
+from collections import defaultdict
+
+
+def serialize_message(message):
+    return {
+        "id": str(message.pk),
+        "sender": str(message.sender),
+        "receiver": str(message.receiver),
+        "content": message.content,
+        "timestamp": message.timestamp,
+        "parent_message": str(message.parent_message_id) if message.parent_message_id else None,
+        "replies": [],
+        "has_more_replies": False,
+    }
+
+
+class MessageThreadIndex:
+    """
+    In-memory index of a message forest.
+
+    The whole forest is read with a single query and every message is
+    filed under its parent's id, so building a thread walks the index
+    instead of going back to the database for each level of replies.
+    """
+
+    def __init__(self, messages):
+        messages = list(messages)
+        ids = {message.pk for message in messages}
+        self.roots = []
+        self.children = defaultdict(list)
+        for message in messages:
+            # A reply whose parent was not loaded (e.g. a subtree) roots its own tree.
+            if message.parent_message_id in ids:
+                self.children[message.parent_message_id].append(message)
+            else:
+                self.roots.append(message)
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        return cls(
+            queryset
+            .select_related("sender", "receiver")
+            .order_by("timestamp", "message_id")
+        )
+
+    def build(self, root, max_depth=None):
+        """Build the nested reply tree under ``root`` without recursion."""
+        tree = serialize_message(root)
+        stack = [(root, tree, 0)]
+        while stack:
+            message, node, depth = stack.pop()
+            replies = self.children.get(message.pk, ())
+            if max_depth is not None and depth >= max_depth:
+                node["has_more_replies"] = bool(replies)
+                continue
+            for reply in replies:
+                child = serialize_message(reply)
+                node["replies"].append(child)
+                stack.append((reply, child, depth + 1))
+        return tree
+
+    def build_all(self, roots=None, max_depth=None):
+        roots = self.roots if roots is None else roots
+        return [self.build(root, max_depth) for root in roots]
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework import routers
 from rest_framework_nested.routers import NestedDefaultRouter   
-from .views import ConversationViewSet, MessageViewSet
+from .views import ConversationViewSet, MessageViewSet, UnreadMessagesView, UnreadCountView, ProfilingStatsView, ThreadedMessagesView
 
 
 router = routers.DefaultRouter()
@@ -14,4 +14,8 @@ conversations_router.register(r'messages', MessageViewSet, basename='conversatio
 urlpatterns = [
     path('', include(router.urls)),
     path('', include(conversations_router.urls)),   
+    path('messages/threads/', ThreadedMessagesView.as_view(), name='message-threads'),
+    path('messages/unread/', UnreadMessagesView.as_view(), name='unread-messages'),
+    path('messages/unread/count/', UnreadCountView.as_view(), name='unread-count'),
+    path('profiling/', ProfilingStatsView.as_view(), name='profiling-stats'),
 ]
\ No newline at end of file
@@ -1,16 +1,30 @@
-from django.shortcuts import render
-from rest_framework import viewsets, status, filters, generics, permissions
+import uuid
+from collections import defaultdict
+
+from django.shortcuts import render, get_object_or_404
+from rest_framework import viewsets, status, generics, permissions
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.response import Response
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from django.core.cache import cache
 from rest_framework.permissions import IsAuthenticated 
 from .models import Message, Conversation, User
-from .serializers import ConversationSerializer, MessageSerializer, UserSerializer
+from .serializers import BulkMessageItemSerializer, ConversationSerializer, MessageSerializer, UserSerializer
 from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action
+from django.utils.dateparse import parse_datetime
 from .permissions import IsParticipantOfConversation
-from .filters import MessageFilter
-from .pagination import MessagePagination
+from .membership import Participants, is_participant
+from .filters import MessageFilter, MessageSearchFilter
+from .pagination import MessageCursorPagination, ThreadPagination
+from .threads import MessageThreadIndex
+from .purge import enqueue_user_purge
+from .counters import unread_count
+from .read_state import mark_read
+from .cache import message_list_cache_key, message_list_ttl
+from .search import search_messages
+from .profiling import reset_stats, route_stats, serializing
+from rest_framework.utils.urls import replace_query_param
 
 
 class ConversationViewSet(viewsets.ModelViewSet):
@@ -19,7 +33,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsParticipantOfConversation]
 
     def get_queryset(self):
-        return Conversation.objects.filter(participants=self.request.user)
+        return Conversation.objects.filter(participants=self.request.user).with_inbox_summary(self.request.user)
 
     def create(self, request, *args, **kwargs):
         participants_ids = request.data.get("participants", [])
@@ -35,47 +49,226 @@ class ConversationViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(conversation)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=True, methods=["post"], url_path="mark-read")
+    def mark_read(self, request, pk=None):
+        """
+        Mark messages read in bulk by moving the read watermark. Send
+        "message_ids", an "up_to" ISO timestamp, or a message list "cursor";
+        everything up to the newest matching message becomes read.
+        """
+        conversation = self.get_object()
+        message_ids = request.data.get("message_ids")
+        up_to = request.data.get("up_to")
+        cursor = request.data.get("cursor")
+
+        if message_ids is None and up_to is None and cursor is None:
+            return Response(
+                {"error": "Provide message_ids, up_to or cursor."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if message_ids is not None:
+            try:
+                message_ids = [uuid.UUID(str(message_id)) for message_id in message_ids]
+            except (TypeError, ValueError):
+                return Response({"error": "message_ids must be a list of message ids."},
+                                status=status.HTTP_400_BAD_REQUEST)
+        if up_to is not None:
+            try:
+                # None when malformed; ValueError when well formed but out of range, e.g. month 13.
+                up_to = parse_datetime(str(up_to))
+            except ValueError:
+                up_to = None
+            if up_to is None:
+                return Response({"error": "up_to must be an ISO timestamp."}, status=status.HTTP_400_BAD_REQUEST)
+        up_to_key = None
+        if cursor is not None:
+            try:
+                _, timestamp, message_id = MessageCursorPagination.decode_token(str(cursor))
+            except ValueError:
+                return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+            up_to_key = (timestamp, message_id)
+
+        updated = mark_read(
+            request.user, conversation, message_ids=message_ids, up_to=up_to, up_to_key=up_to_key
+        )
+        return Response({"marked_read": updated})
+
 class MessageViewSet(viewsets.ModelViewSet):
-    queryset = Message.objects.all().order_by("-sent_at")
+    queryset = Message.objects.all().order_by("-timestamp")
     serializer_class = MessageSerializer
     permission_classes = [IsParticipantOfConversation]
-    pagination_class = MessagePagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # Keyset pagination owns the ordering, so OrderingFilter is not offered here.
+    pagination_class = MessageCursorPagination
+    filter_backends = [DjangoFilterBackend, MessageSearchFilter]
     filterset_class = MessageFilter
-    search_fields = ["message_body"]
-    ordering_fields = ["sent_at"]
-    ordering = ["-sent_at"]
+    search_page_size = 20
+    bulk_max_items = 1000
 
     def get_queryset(self):
         conversation_id = self.request.query_params.get("conversation_id")
         if conversation_id:
-            return Message.objects.filter(conversation_id=conversation_id)
+            return Message.objects.filter(conversation_id=conversation_id).select_related("sender")
         return Message.objects.none()
 
     def create(self, request, *args, **kwargs):
         conversation_id = request.data.get("conversation")
-        message_body = request.data.get("message_body")
+        content = request.data.get("content")
+        receiver_id = request.data.get("receiver")
+        parent_id = request.data.get("parent_message")
 
         try:
-            conversation = Conversation.objects.get(id=conversation_id)
-        except Conversation.DoesNotExist:
-            return Response({"error": "Conversation not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        if request.user not in conversation.participants.all():
+            conversation_id = uuid.UUID(str(conversation_id))
+        except ValueError:
+            return Response({"error": "conversation must be an id."}, status=status.HTTP_400_BAD_REQUEST)
+        if not is_participant(request.user, conversation_id, request):
+            if not Conversation.objects.filter(pk=conversation_id).exists():
+                return Response({"error": "Conversation not found."}, status=status.HTTP_404_NOT_FOUND)
             return Response({"error": "You are not a participant of this conversation."},
                             status=status.HTTP_403_FORBIDDEN)
+        if not content or not receiver_id:
+            return Response({"error": "content and receiver are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            receiver_id = uuid.UUID(str(receiver_id))
+            parent_id = uuid.UUID(str(parent_id)) if parent_id else None
+        except ValueError:
+            return Response({"error": "receiver and parent_message must be ids."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not Participants.objects.filter(conversation_id=conversation_id, user_id=receiver_id).exists():
+            return Response({"error": "The receiver is not a participant of this conversation."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if parent_id is not None:
+            parent_depth = Message.objects.filter(pk=parent_id, conversation_id=conversation_id).values_list(
+                "thread_depth", flat=True
+            ).first()
+            if parent_depth is None:
+                return Response({"error": "The parent message is not in this conversation."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            # Message.save() would refuse the reply with a model ValidationError.
+            if parent_depth >= Message.max_thread_depth:
+                error = f"Replies cannot be nested more than {Message.max_thread_depth} levels deep."
+                return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
         message = Message.objects.create(
-            conversation=conversation,
+            conversation_id=conversation_id,
             sender=request.user,
-            message_body=message_body,
+            receiver_id=receiver_id,
+            parent_message_id=parent_id,
+            content=content,
         )
         serializer = self.get_serializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @method_decorator(cache_page(60))  
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request, *args, **kwargs):
+        """
+        Send many messages in one request: a list of {"conversation",
+        "receiver", "content", "parent_message"} items, or {"messages": [...]}.
+        Membership is checked with one query for the whole batch and valid
+        items are inserted together; invalid ones are skipped and reported
+        by their index.
+        """
+        items = request.data.get("messages") if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({"error": "Provide a non-empty list of messages."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.bulk_max_items:
+            return Response({"error": f"At most {self.bulk_max_items} messages per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        errors, valid = [], []
+        for index, item in enumerate(items):
+            serializer = BulkMessageItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                errors.append({"index": index, "errors": serializer.errors})
+
+        members = defaultdict(set)
+        for conversation_id, user_id in Participants.objects.filter(
+            conversation_id__in={data["conversation"] for _, data in valid},
+            user_id__in={request.user.pk} | {data["receiver"] for _, data in valid},
+        ).values_list("conversation_id", "user_id"):
+            members[conversation_id].add(user_id)
+        parents = Message.objects.only("message_id", "conversation_id", "thread_path", "thread_depth").in_bulk(
+            [data["parent_message"] for _, data in valid if data.get("parent_message")]
+        )
+
+        created, messages = [], []
+        for index, data in valid:
+            conversation_id = data["conversation"]
+            parent = parents.get(data.get("parent_message"))
+            if request.user.pk not in members[conversation_id]:
+                error = "You are not a participant of this conversation."
+            elif data["receiver"] not in members[conversation_id]:
+                error = "The receiver is not a participant of this conversation."
+            elif data.get("parent_message") and (parent is None or parent.conversation_id != conversation_id):
+                error = "The parent message is not in this conversation."
+            elif parent is not None and parent.thread_depth >= Message.max_thread_depth:
+                error = f"Replies cannot be nested more than {Message.max_thread_depth} levels deep."
+            else:
+                created.append(index)
+                messages.append(Message(
+                    conversation_id=conversation_id,
+                    sender=request.user,
+                    receiver_id=data["receiver"],
+                    parent_message=parent,
+                    content=data["content"],
+                ))
+                continue
+            errors.append({"index": index, "errors": {"non_field_errors": [error]}})
+
+        if messages:
+            Message.objects.bulk_send(messages)
+        errors.sort(key=lambda entry: entry["index"])
+        return Response(
+            {
+                "created": [
+                    {"index": index, "message_id": message.pk} for index, message in zip(created, messages)
+                ],
+                "errors": errors,
+            },
+            status=status.HTTP_201_CREATED if messages else status.HTTP_400_BAD_REQUEST,
+        )
+
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        conversation_id = request.query_params.get("conversation_id")
+        if not conversation_id:
+            return super().list(request, *args, **kwargs)
+
+        if not is_participant(request.user, conversation_id, request):
+            return Response({"error": "You are not a participant of this conversation."},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        key = message_list_cache_key(conversation_id, request)
+        data = cache.get(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, message_list_ttl())
+        return Response(data)
+
+    @action(detail=False, methods=["get"])
+    def search(self, request, *args, **kwargs):
+        """
+        Ranked full-text search over the requester's conversations:
+        ?q=<terms>, then follow "next" for more hits.
+        """
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"error": "Provide a search query with ?q=."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            messages, next_cursor = search_messages(
+                request.user, query, limit=self.search_page_size, cursor=request.query_params.get("cursor")
+            )
+        except ValueError:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        next_link = None
+        if next_cursor is not None:
+            next_link = replace_query_param(request.build_absolute_uri(), "cursor", next_cursor)
+        serializer = self.get_serializer(messages, many=True)
+        return Response({"next": next_link, "results": serializer.data})
 
 
 class DeleteUserView(generics.DestroyAPIView):
@@ -84,52 +277,114 @@ class DeleteUserView(generics.DestroyAPIView):
     def get_object(self):
         return self.request.user
 
-    def delete_user(self, request, *args, **kwargs):
+    def destroy(self, request, *args, **kwargs):
         user = self.get_object()
-        user.delete()
-        return Response({"detail": "User account deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
+        # Lock the account now; its data is removed by a background purge.
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        enqueue_user_purge(user.pk)
+        return Response({"detail": "User account scheduled for deletion."}, status=status.HTTP_202_ACCEPTED)
 
 
 
 class ThreadedMessagesView(APIView):
-    def get(self, request, *args, **kwargs):
-        root_messages = (
-            Message.objects
-            .filter(parent_message__isnull=True)
-            .select_related("sender", "receiver")
-            .prefetch_related("replies__sender", "replies__receiver")
-            .order_by("timestamp")
-        )
+    max_depth_query_param = "depth"
 
-        data = [self.build_thread(msg) for msg in root_messages]
-        return Response(data)
+    def get_max_depth(self, request):
+        depth = request.query_params.get(self.max_depth_query_param)
+        if depth is None:
+            return None
+        try:
+            depth = int(depth)
+        except ValueError:
+            raise ValidationError({self.max_depth_query_param: "Must be an integer."})
+        if depth < 0:
+            raise ValidationError({self.max_depth_query_param: "Must not be negative."})
+        return depth
 
-    def build_thread(self, message):
-        return {
-            "id": str(message.id),
-            "sender": str(message.sender),
-            "receiver": str(message.receiver),
-            "content": message.content,
-            "timestamp": message.timestamp,
-            "parent_message": str(message.parent_message.id) if message.parent_message else None,
-            "replies": [
-                self.build_thread(reply) for reply in message.replies.all().order_by("timestamp")
-            ],
-        }
+    def get_id_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return uuid.UUID(value)
+        except ValueError:
+            raise ValidationError({name: "Must be an id."})
+
+    def get_queryset(self):
+        queryset = Message.objects.filter(conversation__participants=self.request.user)
+        conversation_id = self.get_id_param("conversation_id")
+        if conversation_id:
+            queryset = queryset.filter(conversation_id=conversation_id)
+        return queryset
+
+    def get_roots(self):
+        queryset = self.get_queryset()
+        root_id = self.get_id_param("root")
+        if root_id:
+            root = get_object_or_404(queryset, pk=root_id)
+            return queryset.filter(pk=root.pk)
+        return queryset.filter(parent_message__isnull=True).order_by("timestamp", "message_id")
+
+    def get(self, request, *args, **kwargs):
+        max_depth = self.get_max_depth(request)
+        paginator = ThreadPagination()
+        # Page over the roots in SQL, then read just those threads, one
+        # level deeper than shown so cut nodes know they have replies.
+        roots = paginator.paginate_queryset(self.get_roots(), request, view=self)
+        index = MessageThreadIndex.from_queryset(
+            Message.objects.subtrees(roots, max_depth=None if max_depth is None else max_depth + 1)
+        )
+        with serializing():
+            data = index.build_all(max_depth=max_depth)
+        return paginator.get_paginated_response(data)
 
 class UnreadMessagesView(APIView):
     def get(self, request, *args, **kwargs):
-        unread_messages = Message.unread.unread_for_user(request.user).only(
-            "id", "sender", "receiver", "content", "timestamp"
+        unread_messages = (
+            Message.unread.unread_for_user(request.user)
+            .select_related("sender")
+            .only("message_id", "sender__username", "content", "timestamp")
         )
 
         data = [
             {
-                "id": msg.id,
+                "id": msg.pk,
                 "sender": msg.sender.username,
                 "content": msg.content,
                 "timestamp": msg.timestamp,
             }
             for msg in unread_messages
         ]
-        return Response(data)
\ No newline at end of file
+        return Response(data)
+
+
+class UnreadCountView(APIView):
+    """Badge endpoint: reads one counter row instead of counting messages."""
+
+    def get(self, request, *args, **kwargs):
+        conversation_id = request.query_params.get("conversation_id")
+        if conversation_id:
+            try:
+                conversation_id = uuid.UUID(conversation_id)
+            except ValueError:
+                return Response({"error": "conversation_id must be an id."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "conversation_id": conversation_id,
+            "unread": unread_count(request.user, conversation_id),
+        })
+
+
+class ProfilingStatsView(APIView):
+    """
+    Per-route p50/p95/p99 of query count, DB time, serialization time,
+    total time and response size, from this worker process. DELETE clears them.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(route_stats())
+
+    def delete(self, request, *args, **kwargs):
+        reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -38,12 +38,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'messaging.MessagingConfig',
+    'messaging.apps.MessagingConfig',
     'rest_framework_simplejwt',
     'django_filters',
 ]
 
 MIDDLEWARE = [
+    'messaging.profiling.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -125,6 +126,8 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+AUTH_USER_MODEL = 'messaging.User'
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
@@ -143,9 +146,38 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Message list responses are cached per conversation version, so entries
+# can live for hours. LocMemCache is per process: with several workers use
+# a shared backend (Redis, Memcached) so a version bump reaches all of them.
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
     }
-}
\ No newline at end of file
+}
+
+MESSAGE_LIST_CACHE_TTL = 6 * 60 * 60
+
+# Notification fan-out for new messages. "batched" buffers rows and writes
+# them with bulk_create after the transaction commits; "sync" inserts one
+# row per message on the spot, which is easier to assert on in tests.
+NOTIFICATIONS = {
+    'MODE': 'batched',
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Per-route request profiling (see messaging.profiling); aggregates are
+# served to admins at profiling/. Requests over their route's query budget
+# are logged, and QueryBudgetTestMixin fails tests on them. Off outside
+# DEBUG unless enabled here; the Server-Timing header only goes to staff.
+PROFILING = {
+    'ENABLED': DEBUG,
+    'SAMPLE_SIZE': 1000,
+    'QUERY_BUDGETS': {
+        'conversation-list': 5,
+        'conversation-messages-list': 4,
+        'unread-messages': 3,
+        'unread-count': 3,
+    },
+}
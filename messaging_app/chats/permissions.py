@@ -1,5 +1,6 @@
 from rest_framework import permissions
 from .models import Conversation, Message
+from .membership import is_participant
 
 
 class IsParticipantOfConversation(permissions.BasePermission):
@@ -14,11 +15,12 @@ class IsParticipantOfConversation(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         
         if isinstance(obj, Conversation):
-            return request.user in obj.participants.all()
+            return is_participant(request.user, obj.pk, request)
 
         
         if isinstance(obj, Message):
-            if request.user not in obj.conversation.participants.all():
+            # conversation_id avoids loading the conversation row.
+            if not is_participant(request.user, obj.conversation_id, request):
                 return False
             if request.method in ["PUT", "PATCH", "DELETE"]:
                 return True  
@@ -7,14 +7,31 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = '__all__'
+        extra_kwargs = {'password': {'write_only': True}}
+
+class ParticipantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['user_id', 'username', 'first_name', 'last_name']
 
 class ConversationSerializer(serializers.ModelSerializer):
-    participants = UserSerializer(many=True, read_only=True)
-    messages = serializers.SerializerMethodField() 
+    participants = ParticipantSerializer(many=True, read_only=True)
+    last_message = serializers.SerializerMethodField()
 
     class Meta:
         model = Conversation
-        fields = '__all__'
+        fields = ['conversation_id', 'participants', 'created_at', 'last_message']
+
+    def get_last_message(self, obj):
+        # Filled in by ConversationQuerySet.with_inbox_summary(); no query here.
+        if getattr(obj, 'last_message_id', None) is None:
+            return None
+        return {
+            'message_id': obj.last_message_id,
+            'sender_id': obj.last_message_sender_id,
+            'message_body': obj.last_message_body,
+            'sent_at': obj.last_message_at,
+        }
 
 class MessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.SerializerMethodField()
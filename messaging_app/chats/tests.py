@@ -1,3 +1,57 @@
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Conversation, Message, User
+
+
+class QueryPlanTests(TestCase):
+    """
+    Guards the hot queries against regressions to full table scans: seeds
+    enough rows, and statistics, that a poorly matching index would lose
+    to a scan, then checks each query's EXPLAIN output for its index.
+    """
+
+    conversations_count = 10
+    messages_per_conversation = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com", first_name="User", last_name=str(i))
+            for i in range(cls.conversations_count + 1)
+        )
+        cls.conversations = Conversation.objects.bulk_create(
+            Conversation() for _ in range(cls.conversations_count)
+        )
+        messages = []
+        for c, conversation in enumerate(cls.conversations):
+            members = cls.users[c], cls.users[c + 1]
+            conversation.participants.add(*members)
+            messages.extend(
+                Message(conversation=conversation, sender=members[i % 2], message_body=f"message {i}")
+                for i in range(cls.messages_per_conversation)
+            )
+        Message.objects.bulk_create(messages)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.conversation = cls.conversations[0]
+
+    def explain(self, queryset):
+        if connection.vendor == "postgresql":
+            # Test tables are small enough that a sequential scan always wins.
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = self.explain(queryset)
+        self.assertIn(index_name, plan, f"{index_name} not used:\n{plan}")
+
+    def test_message_list_page(self):
+        queryset = Message.objects.filter(conversation=self.conversation).order_by("-sent_at", "-message_id")
+        self.assertUsesIndex(queryset[:20], "message_conv_sent_idx")
+
+    def test_inbox_latest_message(self):
+        # The latest-message subqueries run once per conversation listed.
+        queryset = Conversation.objects.filter(participants=self.users[0]).with_inbox_summary()
+        self.assertUsesIndex(queryset, "message_conv_sent_idx")
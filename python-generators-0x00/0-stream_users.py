@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+"""
+Stream query results one row at a time, in constant memory.
+
+Rows are pulled from the server ``arraysize`` at a time: through a
+server-side (named) cursor on PostgreSQL, an unbuffered cursor on MySQL,
+and plain ``fetchmany`` elsewhere (e.g. SQLite). Memory use depends on
+the batch size, never on the size of the result.
+
+Run directly to stream generated rows from SQLite and watch peak RSS:
+
+    python3 0-stream_users.py --rows 10000000
+"""
+import itertools
+from collections import namedtuple
+
+DEFAULT_ARRAYSIZE = 1000
+ROW_FACTORIES = ("tuple", "namedtuple", "dict")
+
+_cursor_names = itertools.count(1)
+
+
+def _driver(connection):
+    return type(connection).__module__.split(".")[0]
+
+
+def open_stream_cursor(connection, arraysize=DEFAULT_ARRAYSIZE):
+    """A cursor on ``connection`` that fetches from the server in batches."""
+    driver = _driver(connection)
+    if driver in ("psycopg2", "psycopg"):
+        cursor = connection.cursor(name=f"stream_{next(_cursor_names)}")
+        cursor.itersize = arraysize
+    elif driver == "mysql":
+        cursor = connection.cursor(buffered=False)
+    else:
+        cursor = connection.cursor()
+    cursor.arraysize = arraysize
+    return cursor
+
+
+def row_factory_for(kind, description):
+    """A callable turning a row tuple into ``kind``, or None to keep tuples."""
+    if kind not in ROW_FACTORIES:
+        raise ValueError(f"row_factory must be one of {', '.join(ROW_FACTORIES)}")
+    if kind == "tuple":
+        return None
+    names = [column[0] for column in description]
+    if kind == "dict":
+        return lambda row: dict(zip(names, row))
+    return namedtuple("Row", names, rename=True)._make
+
+
+def _kill_query(connection, side_connection):
+    import mysql.connector
+
+    side = side_connection()
+    try:
+        cursor = side.cursor()
+        cursor.execute(f"KILL QUERY {int(connection.connection_id)}")
+        cursor.close()
+    finally:
+        side.close()
+    try:
+        # Only what the server sent before the kill is left to read.
+        connection.consume_results()
+    except mysql.connector.Error:
+        # The interrupted query ends its result with an error packet.
+        pass
+
+
+def _close(connection, cursor, finished, close_connection, side_connection=None):
+    if not finished and _driver(connection) == "mysql":
+        if close_connection:
+            # Dropping the connection makes the server abandon the result.
+            connection.close()
+            return
+        if side_connection is not None:
+            _kill_query(connection, side_connection)
+        else:
+            # The rest of an unbuffered result must be read before the
+            # connection can be used again: the whole remaining result
+            # crosses the wire, however early the stream was abandoned.
+            connection.consume_results()
+    cursor.close()
+    if close_connection:
+        connection.close()
+
+
+def stream_batches(connection, query, params=(), arraysize=DEFAULT_ARRAYSIZE, cancel=None,
+                   close_connection=False, side_connection=None):
+    """
+    Yield ``(description, rows)`` for each batch of up to ``arraysize`` row
+    tuples of ``query``. Stops early once ``cancel`` (a threading.Event) is
+    set, or when the generator is closed; either way the cursor is closed,
+    and the connection too if ``close_connection`` is true.
+
+    A MySQL connection that stays open has to read the rest of an
+    abandoned result before its next query. Pass ``side_connection``, a
+    callable opening another connection with the same credentials, to
+    stop the query with KILL QUERY from there instead.
+    """
+    cursor = open_stream_cursor(connection, arraysize)
+    finished = False
+    try:
+        cursor.execute(query, params)
+        while cancel is None or not cancel.is_set():
+            rows = cursor.fetchmany(arraysize)
+            if not rows:
+                finished = True
+                return
+            # Named cursors only describe their columns after the first fetch.
+            yield cursor.description, rows
+    finally:
+        _close(connection, cursor, finished, close_connection, side_connection)
+
+
+def stream_rows(connection, query, params=(), row_factory="dict", arraysize=DEFAULT_ARRAYSIZE,
+                cancel=None, close_connection=False, side_connection=None):
+    """
+    Yield the rows of ``query`` one at a time as tuples, namedtuples or
+    dicts. Cancellation and cleanup work as for ``stream_batches``.
+    """
+    if row_factory not in ROW_FACTORIES:
+        raise ValueError(f"row_factory must be one of {', '.join(ROW_FACTORIES)}")
+    make_row = None
+    batches = stream_batches(connection, query, params, arraysize, cancel, close_connection, side_connection)
+    try:
+        for description, rows in batches:
+            if make_row is None:
+                make_row = row_factory_for(row_factory, description) or tuple
+            yield from map(make_row, rows)
+    finally:
+        # A consumer that stops early closes this generator; close the
+        # batches now too, rather than whenever they are collected.
+        batches.close()
+
+
+def stream_users(row_factory="dict", arraysize=DEFAULT_ARRAYSIZE, cancel=None):
+    """Yield the rows of user_data one at a time, as dicts by default."""
+    seed = __import__("seed")
+    connection = seed.connect_to_prodev()
+    if connection is None:
+        return
+    yield from stream_rows(
+        connection,
+        "SELECT user_id, name, email, age FROM user_data",
+        row_factory=row_factory,
+        arraysize=arraysize,
+        cancel=cancel,
+        close_connection=True,
+    )
+
+
+def _benchmark(rows, arraysize, row_factory):
+    import resource
+    import sqlite3
+    import time
+
+    connection = sqlite3.connect(":memory:")
+    query = (
+        "WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?) "
+        "SELECT n AS user_id, 'user ' || n AS name, 'user' || n || '@example.com' AS email, "
+        "18 + n % 80 AS age FROM seq"
+    )
+    step = max(1, rows // 10)
+    started = time.perf_counter()
+    for count, _ in enumerate(stream_rows(connection, query, (rows,), row_factory, arraysize), 1):
+        if count % step == 0:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{count:>12,} rows  {count / (time.perf_counter() - started):>12,.0f} rows/s  "
+                  f"peak RSS {peak:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stream generated rows from SQLite and report peak RSS.")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--arraysize", type=int, default=DEFAULT_ARRAYSIZE)
+    parser.add_argument("--row-factory", choices=ROW_FACTORIES, default="dict")
+    args = parser.parse_args()
+    _benchmark(args.rows, args.arraysize, args.row_factory)
@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+"""
+Process user_data in column-oriented batches.
+
+A batch holds one array per column instead of one dict per row: NumPy
+arrays when NumPy is installed, otherwise an ``array.array`` for numeric
+columns and a list for text. Integer columns keep integer values; other
+numeric columns become floats. Filters and projections work on whole
+columns, which with NumPy means one C loop per column and batch.
+"""
+import itertools
+import operator
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+stream = __import__("0-stream_users")
+
+USER_COLUMNS = ("user_id", "name", "email", "age")
+NUMERIC_COLUMNS = frozenset({"age"})
+# age is DECIMAL with no fraction digits; floats would print it as 67.0.
+INTEGER_COLUMNS = frozenset({"age"})
+
+COMPARISONS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+def _integer_column(values):
+    values = [int(value) for value in values]
+    if np is not None:
+        return np.asarray(values, dtype=np.int64)
+    return array("q", values)
+
+
+def _numeric_column(values):
+    if np is not None:
+        return np.asarray(values, dtype=np.float64)
+    return array("d", values)
+
+
+def _text_column(values):
+    if np is not None:
+        return np.asarray(values, dtype=object)
+    return list(values)
+
+
+def _column(name, values, numeric, integer):
+    if name in integer:
+        return _integer_column(values)
+    if name in numeric:
+        return _numeric_column(values)
+    return _text_column(values)
+
+
+class ColumnBatch:
+    """Rows stored column by column: ``columns`` maps a column name to its values."""
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, names, rows, numeric=NUMERIC_COLUMNS, integer=INTEGER_COLUMNS):
+        """
+        Transpose row tuples into columns; ``integer`` columns become int64
+        arrays, other ``numeric`` columns float arrays.
+        """
+        transposed = zip(*rows) if rows else [()] * len(names)
+        return cls({name: _column(name, values, numeric, integer) for name, values in zip(names, transposed)})
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), ()))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def mask(self, name, op, value):
+        """Boolean mask of the rows where ``column op value`` holds."""
+        compare = COMPARISONS[op]
+        column = self.columns[name]
+        if np is not None:
+            return compare(column, value)
+        return [compare(item, value) for item in column]
+
+    def filter(self, mask):
+        if np is not None:
+            return ColumnBatch({name: column[mask] for name, column in self.columns.items()})
+        columns = {}
+        for name, column in self.columns.items():
+            kept = itertools.compress(column, mask)
+            columns[name] = array(column.typecode, kept) if isinstance(column, array) else list(kept)
+        return ColumnBatch(columns)
+
+    def where(self, name, op, value):
+        return self.filter(self.mask(name, op, value))
+
+    def select(self, *names):
+        """Projection: a batch sharing the given columns."""
+        return ColumnBatch({name: self.columns[name] for name in names})
+
+    def rows(self):
+        """Yield each row as a dict, for output; avoid this on hot paths."""
+        names = list(self.columns)
+        columns = [column.tolist() if hasattr(column, "tolist") else column for column in self.columns.values()]
+        for values in zip(*columns):
+            yield dict(zip(names, values))
+
+
+def stream_column_batches(connection, query, params=(), batch_size=1000, numeric=NUMERIC_COLUMNS,
+                          integer=INTEGER_COLUMNS, **kwargs):
+    """Yield the result of ``query`` as ColumnBatch objects of up to ``batch_size`` rows."""
+    for description, rows in stream.stream_batches(connection, query, params, batch_size, **kwargs):
+        yield ColumnBatch.from_rows([column[0] for column in description], rows, numeric, integer)
+
+
+def stream_users_in_batches(batch_size):
+    """Yield user_data in ColumnBatch objects of up to ``batch_size`` rows."""
+    seed = __import__("seed")
+    connection = seed.connect_to_prodev()
+    if connection is None:
+        return
+    yield from stream_column_batches(
+        connection,
+        f"SELECT {', '.join(USER_COLUMNS)} FROM user_data",
+        batch_size=batch_size,
+        close_connection=True,
+    )
+
+
+def filter_batches(batches, name, op, value, columns=None):
+    """Filter each batch on ``name op value`` and keep only ``columns``; empty batches are dropped."""
+    for batch in batches:
+        mask = batch.mask(name, op, value)
+        # Project before filtering so dropped columns are never copied.
+        if columns is not None:
+            batch = batch.select(*columns)
+        batch = batch.filter(mask)
+        if len(batch):
+            yield batch
+
+
+def batch_processing(batch_size, min_age=25):
+    """Print the users older than ``min_age``, filtering a whole batch at a time."""
+    for batch in filter_batches(stream_users_in_batches(batch_size), "age", ">", min_age):
+        for user in batch.rows():
+            print(user)
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+"""
+Lazily page through user_data.
+
+``lazy_paginate`` walks the table in primary-key order with keyset
+pagination (``WHERE user_id > last seen ORDER BY user_id LIMIT n``): every
+page is one index range read, however deep into the table it is, where
+LIMIT/OFFSET has to skip over every earlier row again. With ``prefetch``
+the next page is fetched on a background thread while the caller works
+on the current one.
+"""
+import queue
+import threading
+
+COLUMNS = "user_id, name, email, age"
+
+
+def paginate_users(page_size, offset):
+    """One page of users by LIMIT/OFFSET; each call costs O(offset). Prefer ``lazy_paginate``."""
+    seed = __import__("seed")
+    connection = seed.connect_to_prodev()
+    if connection is None:
+        return []
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(f"SELECT {COLUMNS} FROM user_data ORDER BY user_id LIMIT %s OFFSET %s", (page_size, offset))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    finally:
+        connection.close()
+
+
+def paginate_users_after(connection, page_size, after=None):
+    """The first ``page_size`` users whose user_id sorts after ``after`` (from the start if None)."""
+    cursor = connection.cursor(dictionary=True)
+    if after is None:
+        cursor.execute(f"SELECT {COLUMNS} FROM user_data ORDER BY user_id LIMIT %s", (page_size,))
+    else:
+        cursor.execute(
+            f"SELECT {COLUMNS} FROM user_data WHERE user_id > %s ORDER BY user_id LIMIT %s", (after, page_size)
+        )
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def keyset_pages(page_size):
+    """Yield every page of user_data in user_id order, on one connection."""
+    seed = __import__("seed")
+    connection = seed.connect_to_prodev()
+    if connection is None:
+        return
+    try:
+        after = None
+        while True:
+            page = paginate_users_after(connection, page_size, after)
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            after = page[-1]["user_id"]
+    finally:
+        connection.close()
+
+
+_DONE = object()
+
+
+def prefetched(iterable, depth=1):
+    """
+    Iterate ``iterable`` on a background thread, keeping up to ``depth``
+    items ready ahead of the consumer. Errors are re-raised to the
+    consumer; closing the generator stops the thread, which then closes
+    ``iterable`` itself.
+    """
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                ready.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except Exception as error:
+            put((_DONE, error))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name="lazy-paginate-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = ready.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def lazy_paginate(page_size, prefetch=True):
+    """
+    Yield user_data one page (a list of dicts) at a time, in user_id
+    order, fetching each page only when needed, or one page ahead with
+    ``prefetch``.
+    """
+    pages = keyset_pages(page_size)
+    if prefetch:
+        pages = prefetched(pages)
+    yield from pages
+
+
+lazy_pagination = lazy_paginate
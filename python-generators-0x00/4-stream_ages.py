@@ -0,0 +1,310 @@
+#!/usr/bin/python3
+"""
+One-pass aggregates over streamed values, in constant memory.
+
+``StreamAggregates`` keeps count, sum, mean, variance (Welford), min and
+max exactly, approximate quantiles through a KLL sketch, and a
+fixed-width histogram. ``consume`` feeds it from any generator in this
+package: single values, row dicts or namedtuples, pages (lists of rows)
+or column batches. Where the database can do the work, ``sql_aggregates``
+pushes the exact aggregates down into one query instead.
+
+Run directly for the average age of users:
+
+    python3 4-stream_ages.py [--pushdown]
+"""
+import math
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+stream = __import__("0-stream_users")
+
+
+class RunningStats:
+    """Count, sum, mean, variance, min and max, updated one value or one batch at a time."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def add_many(self, values):
+        if np is None:
+            for value in values:
+                self.add(value)
+            return
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        batch_mean = float(values.mean())
+        self._merge(len(values), float(values.sum()), batch_mean, float(((values - batch_mean) ** 2).sum()),
+                    float(values.min()), float(values.max()))
+
+    def merge(self, other):
+        """Fold in the stats of another stream (Chan et al.'s parallel update)."""
+        if other.count:
+            self._merge(other.count, other.total, other.mean, other._m2, other.min, other.max)
+
+    def _merge(self, count, total, mean, m2, low, high):
+        combined = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / combined
+        self._m2 += m2 + delta * delta * self.count * count / combined
+        self.count = combined
+        self.total += total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    @property
+    def variance(self):
+        """Population variance."""
+        return self._m2 / self.count if self.count else math.nan
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang and Liberty). Keeps O(k) values in a
+    stack of compactors; each compaction sorts a full level and promotes
+    every other value, at double weight, to the level above. Rank error is
+    about 1.7/k with high probability.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.rng = random.Random(seed)
+        self.compactors = []
+        self.size = 0
+        self.max_size = 0
+        self._grow()
+
+    def _capacity(self, height):
+        depth = len(self.compactors) - height - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _grow(self):
+        self.compactors.append([])
+        self.max_size = sum(self._capacity(height) for height in range(len(self.compactors)))
+
+    def add(self, value):
+        self.compactors[0].append(float(value))
+        self.size += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    def add_many(self, values):
+        values = values.tolist() if hasattr(values, "tolist") else [float(value) for value in values]
+        self.compactors[0].extend(values)
+        self.size += len(values)
+        while self.size >= self.max_size:
+            self._compress()
+
+    def _compress(self):
+        for height, items in enumerate(self.compactors):
+            if len(items) >= self._capacity(height):
+                if height + 1 == len(self.compactors):
+                    self._grow()
+                items.sort()
+                kept = items[self.rng.random() < 0.5::2]
+                self.compactors[height + 1].extend(kept)
+                self.size -= len(items) - len(kept)
+                items.clear()
+                return
+
+    def quantile(self, q):
+        weighted = sorted(
+            (value, 1 << height) for height, items in enumerate(self.compactors) for value in items
+        )
+        if not weighted:
+            return math.nan
+        target = q * sum(weight for _, weight in weighted)
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return value
+        return weighted[-1][0]
+
+
+class Histogram:
+    """Counts per fixed-width bin; memory grows with the value range, not the count."""
+
+    def __init__(self, width=10, origin=0):
+        self.width = width
+        self.origin = origin
+        self.bins = {}
+
+    def add(self, value):
+        index = math.floor((float(value) - self.origin) / self.width)
+        self.bins[index] = self.bins.get(index, 0) + 1
+
+    def add_many(self, values):
+        if np is None:
+            for value in values:
+                self.add(value)
+            return
+        indexes, counts = np.unique(
+            np.floor((np.asarray(values, dtype=np.float64) - self.origin) / self.width), return_counts=True
+        )
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            self.bins[int(index)] = self.bins.get(int(index), 0) + count
+
+    def items(self):
+        """``((low, high), count)`` per non-empty bin, lowest first."""
+        for index in sorted(self.bins):
+            low = self.origin + index * self.width
+            yield (low, low + self.width), self.bins[index]
+
+
+class StreamAggregates:
+    def __init__(self, quantiles=(0.5, 0.9, 0.99), k=200, bin_width=10, seed=None):
+        self.quantiles = quantiles
+        self.stats = RunningStats()
+        self.sketch = KLLSketch(k=k, seed=seed)
+        self.histogram = Histogram(width=bin_width) if bin_width else None
+
+    def add(self, value):
+        self.stats.add(value)
+        self.sketch.add(value)
+        if self.histogram is not None:
+            self.histogram.add(value)
+
+    def add_many(self, values):
+        if np is not None:
+            values = np.asarray(values, dtype=np.float64)
+        else:
+            values = [float(value) for value in values]
+        self.stats.add_many(values)
+        self.sketch.add_many(values)
+        if self.histogram is not None:
+            self.histogram.add_many(values)
+
+    def result(self):
+        stats = self.stats
+        result = {
+            "count": stats.count,
+            "sum": stats.total,
+            "mean": stats.mean if stats.count else math.nan,
+            "variance": stats.variance,
+            "stddev": stats.stddev,
+            "min": stats.min if stats.count else math.nan,
+            "max": stats.max if stats.count else math.nan,
+            "quantiles": {q: self.sketch.quantile(q) for q in self.quantiles},
+        }
+        if self.histogram is not None:
+            result["histogram"] = list(self.histogram.items())
+        return result
+
+
+def _value(item, column):
+    if column is None:
+        if isinstance(item, dict) or hasattr(item, "_fields"):
+            raise ValueError("consume needs a column to read values from rows")
+        return item
+    if isinstance(item, dict):
+        return item[column]
+    return getattr(item, column)
+
+
+def consume(source, column=None, aggregates=None):
+    """
+    Feed every value of ``source`` to ``aggregates`` (a new
+    StreamAggregates by default) and return it. Items may be values, rows
+    (dicts or namedtuples, read at ``column``), pages of rows, or column
+    batches, which are added a whole column at a time. Rows and column
+    batches need ``column``; ValueError without it.
+    """
+    aggregates = aggregates if aggregates is not None else StreamAggregates()
+    for item in source:
+        if hasattr(item, "columns"):
+            if column is None:
+                raise ValueError(
+                    f"consume needs a column to read from column batches, one of {', '.join(item.columns)}"
+                )
+            aggregates.add_many(item[column])
+        elif isinstance(item, list):
+            aggregates.add_many([_value(row, column) for row in item])
+        else:
+            aggregates.add(_value(item, column))
+    return aggregates
+
+
+def sql_aggregates(connection, table="user_data", column="age"):
+    """
+    Count, sum, mean, variance, min and max of ``column`` computed by the
+    database in one query; only a single row crosses the wire. Quantiles
+    and histograms need the values, so use ``consume`` for those.
+    """
+    cursor = connection.cursor()
+    cursor.execute(
+        f"SELECT COUNT({column}), SUM({column}), MIN({column}), MAX({column}), "
+        f"SUM({column} * {column}) FROM {table}"
+    )
+    count, total, low, high, squares = cursor.fetchone()
+    cursor.close()
+    if not count:
+        return {"count": 0, "sum": 0.0, "mean": math.nan, "variance": math.nan, "stddev": math.nan,
+                "min": math.nan, "max": math.nan}
+    total, squares = float(total), float(squares)
+    mean = total / count
+    # Textbook formula: fine for small values like ages, less stable than Welford in general.
+    variance = max(0.0, squares / count - mean * mean)
+    return {"count": count, "sum": total, "mean": mean, "variance": variance, "stddev": math.sqrt(variance),
+            "min": float(low), "max": float(high)}
+
+
+def stream_user_ages():
+    """Yield the age of every user, one at a time."""
+    seed = __import__("seed")
+    connection = seed.connect_to_prodev()
+    if connection is None:
+        return
+    for (age,) in stream.stream_rows(connection, "SELECT age FROM user_data", row_factory="tuple",
+                                     close_connection=True):
+        yield age
+
+
+def average_age(pushdown=False):
+    """Mean user age, NaN when there are no users (or no connection)."""
+    if pushdown:
+        seed = __import__("seed")
+        connection = seed.connect_to_prodev()
+        if connection is None:
+            return math.nan
+        try:
+            return sql_aggregates(connection)["mean"]
+        finally:
+            connection.close()
+    stats = consume(stream_user_ages()).stats
+    return stats.mean if stats.count else math.nan
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the average age of users.")
+    parser.add_argument("--pushdown", action="store_true", help="let the database compute it")
+    args = parser.parse_args()
+    print(f"Average age of users: {average_age(pushdown=args.pushdown):.2f}")
@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+"""
+Create the ALX_prodev database and bulk-load user_data from a CSV file.
+
+Credentials are read from MYSQL_HOST, MYSQL_PORT, MYSQL_USER and
+MYSQL_PASSWORD, and default to a local root login.
+
+``insert_data`` streams the CSV and loads it in one transaction, either
+with LOAD DATA LOCAL INFILE into a staging table (when the server allows
+local infile) or with batched multi-row INSERTs. Loads are upserts keyed
+on email, so seeding again updates rows instead of duplicating them.
+"""
+import csv
+import itertools
+import os
+import time
+import uuid
+
+import mysql.connector
+
+DATABASE = "ALX_prodev"
+CSV_COLUMNS = ("name", "email", "age")
+DEFAULT_BATCH_SIZE = 5000
+# Errors meaning local infile is turned off, on the server (1148, 3948) or
+# the client (2068); only these make "auto" fall back to inserts.
+LOCAL_INFILE_ERRORS = frozenset({1148, 3948, 2068})
+
+
+def _credentials():
+    return {
+        "host": os.environ.get("MYSQL_HOST", "localhost"),
+        "port": int(os.environ.get("MYSQL_PORT", 3306)),
+        "user": os.environ.get("MYSQL_USER", "root"),
+        "password": os.environ.get("MYSQL_PASSWORD", ""),
+    }
+
+
+def connect_db():
+    """Connect to the MySQL server without selecting a database."""
+    try:
+        return mysql.connector.connect(**_credentials())
+    except mysql.connector.Error as err:
+        print(f"Error connecting to MySQL: {err}")
+        return None
+
+
+def create_database(connection):
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DATABASE}")
+    cursor.close()
+
+
+def connect_to_prodev(allow_local_infile=False):
+    """Connect to the ALX_prodev database; ``allow_local_infile`` enables the LOAD DATA fast path."""
+    try:
+        return mysql.connector.connect(
+            database=DATABASE, allow_local_infile=allow_local_infile, **_credentials()
+        )
+    except mysql.connector.Error as err:
+        print(f"Error connecting to {DATABASE}: {err}")
+        return None
+
+
+def create_table(connection):
+    """
+    Create user_data. The unique email key is what makes reloading an
+    upsert; a table created before it existed needs it added by hand.
+    """
+    cursor = connection.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS user_data ("
+        "user_id CHAR(36) NOT NULL PRIMARY KEY, "
+        "name VARCHAR(255) NOT NULL, "
+        "email VARCHAR(255) NOT NULL, "
+        "age DECIMAL NOT NULL, "
+        "UNIQUE KEY user_data_email (email))"
+    )
+    cursor.close()
+    print("Table user_data created successfully")
+
+
+UPSERT = (
+    "INSERT INTO user_data (user_id, name, email, age) VALUES (%s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE name = VALUES(name), age = VALUES(age)"
+)
+
+
+def read_users(path):
+    """Yield ``(user_id, name, email, age)`` per CSV row, reading the file as it goes."""
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        reader = csv.reader(csv_file)
+        header = [name.strip() for name in next(reader)]
+        positions = [header.index(column) for column in CSV_COLUMNS]
+        id_position = header.index("user_id") if "user_id" in header else None
+        for row in reader:
+            if not row:
+                continue
+            user_id = row[id_position] if id_position is not None else str(uuid.uuid4())
+            yield (user_id, *(row[position] for position in positions))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _insert_batches(cursor, path, batch_size, progress):
+    loaded = 0
+    for batch in batched(read_users(path), batch_size):
+        # mysql.connector rewrites executemany() of an INSERT into multi-row INSERTs.
+        cursor.executemany(UPSERT, batch)
+        loaded += len(batch)
+        if progress:
+            progress(loaded)
+    return loaded
+
+
+def _load_data(cursor, path):
+    with open(path, "rb") as csv_file:
+        first_line = csv_file.readline()
+    header = [name.strip().strip('"') for name in first_line.decode("utf-8").strip().split(",")]
+    line_end = "\\r\\n" if first_line.endswith(b"\r\n") else "\\n"
+    columns = ", ".join(name if name in CSV_COLUMNS + ("user_id",) else "@skip" for name in header)
+
+    cursor.execute(
+        "CREATE TEMPORARY TABLE user_data_staging ("
+        "user_id CHAR(36) NULL, name VARCHAR(255), email VARCHAR(255), age DECIMAL)"
+    )
+    try:
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE user_data_staging "
+            f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+            f"LINES TERMINATED BY '{line_end}' IGNORE 1 LINES ({columns})",
+            (os.path.abspath(path),),
+        )
+        loaded = cursor.rowcount
+        cursor.execute(
+            "INSERT INTO user_data (user_id, name, email, age) "
+            "SELECT COALESCE(user_id, UUID()), name, email, age FROM user_data_staging "
+            "ON DUPLICATE KEY UPDATE name = VALUES(name), age = VALUES(age)"
+        )
+    finally:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS user_data_staging")
+    return loaded
+
+
+def insert_data(connection, data, batch_size=DEFAULT_BATCH_SIZE, method="auto", progress=None):
+    """
+    Load the CSV file ``data`` into user_data in a single transaction and
+    return the number of rows read. ``method`` is "load_data", "insert",
+    or "auto" to try LOAD DATA and fall back to batched inserts when the
+    server or connection refuses local infile; any other error is raised.
+    ``progress(rows)`` is called after each insert batch.
+    """
+    started = time.perf_counter()
+    cursor = connection.cursor()
+    try:
+        loaded = None
+        if method in ("auto", "load_data"):
+            try:
+                loaded = _load_data(cursor, data)
+            except mysql.connector.Error as err:
+                if method == "load_data" or err.errno not in LOCAL_INFILE_ERRORS:
+                    raise
+                print(f"LOAD DATA unavailable ({err}); using batched inserts")
+                connection.rollback()
+        if loaded is None:
+            loaded = _insert_batches(cursor, data, batch_size, progress)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {loaded} rows in {elapsed:.2f} s ({loaded / elapsed if elapsed else 0:,.0f} rows/s)")
+    return loaded
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create ALX_prodev.user_data and load a CSV into it.")
+    parser.add_argument("csv", nargs="?", default="user_data.csv")
+    parser.add_argument("--method", choices=("auto", "load_data", "insert"), default="auto")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    server = connect_db()
+    if server is not None:
+        create_database(server)
+        server.close()
+        connection = connect_to_prodev(allow_local_infile=args.method != "insert")
+        if connection is not None:
+            create_table(connection)
+            insert_data(connection, args.csv, batch_size=args.batch_size, method=args.method)
+            connection.close()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+"""Unit tests for the 1-batch_processing module.
+
+Covers:
+- ColumnBatch
+- stream_column_batches
+- filter_batches
+"""
+
+import sqlite3
+import unittest
+from decimal import Decimal
+
+batching = __import__("1-batch_processing")
+
+NAMES = ("user_id", "name", "email", "age")
+# MySQL returns DECIMAL columns, such as age, as Decimal.
+ROWS = [
+    ("id-1", "Ada", "ada@example.com", Decimal("36")),
+    ("id-2", "Alan", "alan@example.com", Decimal("41")),
+    ("id-3", "Grace", "grace@example.com", Decimal("67")),
+]
+
+
+class TestColumnBatch(unittest.TestCase):
+    """Tests for ColumnBatch."""
+
+    def test_integer_columns_stay_integers(self):
+        """An integral DECIMAL column comes back as ints, so 67 prints as 67, not 67.0."""
+        batch = batching.ColumnBatch.from_rows(NAMES, ROWS)
+        ages = [row["age"] for row in batch.rows()]
+        self.assertEqual(ages, [36, 41, 67])
+        self.assertTrue(all(type(age) is int for age in ages))
+        self.assertIn("'age': 67}", str(list(batch.rows())[-1]))
+
+    def test_other_numeric_columns_are_floats(self):
+        """Numeric columns not listed as integer become floats."""
+        batch = batching.ColumnBatch.from_rows(("score",), [(Decimal("1.5"),), (Decimal("2"),)],
+                                               numeric={"score"}, integer=frozenset())
+        scores = [row["score"] for row in batch.rows()]
+        self.assertEqual(scores, [1.5, 2.0])
+        self.assertTrue(all(type(score) is float for score in scores))
+
+    def test_filtering_keeps_integers(self):
+        """Filtered and projected batches keep integer columns integral."""
+        batch = batching.ColumnBatch.from_rows(NAMES, ROWS).where("age", ">", 40).select("name", "age")
+        self.assertEqual(list(batch.rows()), [{"name": "Alan", "age": 41}, {"name": "Grace", "age": 67}])
+        self.assertTrue(all(type(row["age"]) is int for row in batch.rows()))
+
+    def test_empty(self):
+        """A batch of no rows still has every column."""
+        batch = batching.ColumnBatch.from_rows(NAMES, [])
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(list(batch.columns), list(NAMES))
+
+
+class TestStreamColumnBatches(unittest.TestCase):
+    """Tests for stream_column_batches and filter_batches, against in-memory SQLite."""
+
+    def setUp(self):
+        self.connection = sqlite3.connect(":memory:")
+        self.addCleanup(self.connection.close)
+        self.connection.execute("CREATE TABLE user_data (user_id TEXT, name TEXT, email TEXT, age NUMERIC)")
+        self.connection.executemany(
+            "INSERT INTO user_data VALUES (?, ?, ?, ?)",
+            [(f"id-{i}", f"user {i}", f"user{i}@example.com", 18 + i % 60) for i in range(25)],
+        )
+
+    def batches(self):
+        return batching.stream_column_batches(
+            self.connection, "SELECT user_id, name, email, age FROM user_data ORDER BY user_id", batch_size=10
+        )
+
+    def test_batch_sizes(self):
+        """Rows arrive in column batches of at most batch_size."""
+        self.assertEqual([len(batch) for batch in self.batches()], [10, 10, 5])
+
+    def test_filter_batches(self):
+        """Only matching rows and the chosen columns are kept, with integer ages."""
+        rows = [row for batch in batching.filter_batches(self.batches(), "age", ">=", 40, columns=("age",))
+                for row in batch.rows()]
+        self.assertEqual(sorted(row["age"] for row in rows), [40, 41, 42])
+        self.assertTrue(all(type(row["age"]) is int for row in rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
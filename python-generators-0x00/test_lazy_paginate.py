@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""Unit tests for the 2-lazy_paginate module.
+
+The seed module is replaced by a stand-in whose connections are backed by
+in-memory SQLite, so no MySQL server is needed.
+
+Covers:
+- paginate_users
+- keyset_pages / lazy_paginate
+- prefetched
+"""
+
+import sqlite3
+import sys
+import types
+import unittest
+from unittest.mock import Mock, patch
+
+paginate = __import__("2-lazy_paginate")
+
+
+class DictCursor:
+    """The slice of a mysql.connector dictionary cursor the module uses."""
+
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+        self.closed = False
+
+    def execute(self, query, params=()):
+        self.cursor.execute(query.replace("%s", "?"), params)
+
+    def fetchall(self):
+        names = [column[0] for column in self.cursor.description]
+        return [dict(zip(names, row)) for row in self.cursor.fetchall()]
+
+    def close(self):
+        self.closed = True
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    """A user_data table behind a mysql.connector-like connection."""
+
+    def __init__(self, rows):
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE user_data (user_id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER)"
+        )
+        self.connection.executemany(
+            "INSERT INTO user_data VALUES (?, ?, ?, ?)",
+            [(i, f"user {i}", f"user{i}@example.com", 20 + i % 50) for i in range(1, rows + 1)],
+        )
+        self.cursors = []
+        self.closed = False
+
+    def cursor(self, dictionary=False):
+        cursor = DictCursor(self.connection)
+        self.cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        self.closed = True
+
+
+def fake_seed(connection):
+    """A seed module whose connect_to_prodev returns ``connection``."""
+    module = types.ModuleType("seed")
+    module.connect_to_prodev = Mock(return_value=connection)
+    return patch.dict(sys.modules, {"seed": module})
+
+
+class TestPaginateUsers(unittest.TestCase):
+    """Tests for paginate_users."""
+
+    def test_page_at_offset(self):
+        """A page starts at offset and closes everything it opened."""
+        connection = SQLiteConnection(10)
+        with fake_seed(connection):
+            page = paginate.paginate_users(3, 4)
+        self.assertEqual([row["user_id"] for row in page], [5, 6, 7])
+        self.assertTrue(connection.cursors[0].closed)
+        self.assertTrue(connection.closed)
+
+    def test_no_connection(self):
+        """Without a connection there is no page, rather than an AttributeError."""
+        with fake_seed(None):
+            self.assertEqual(paginate.paginate_users(3, 0), [])
+
+
+class TestLazyPaginate(unittest.TestCase):
+    """Tests for keyset_pages and lazy_paginate."""
+
+    def test_keyset_pages(self):
+        """Pages cover the table once, in order, and stop after a short page."""
+        connection = SQLiteConnection(7)
+        with fake_seed(connection):
+            pages = list(paginate.keyset_pages(3))
+        self.assertEqual([[row["user_id"] for row in page] for page in pages], [[1, 2, 3], [4, 5, 6], [7]])
+        self.assertTrue(connection.closed)
+
+    def test_exact_multiple(self):
+        """A table that fills its last page ends on the following empty read."""
+        connection = SQLiteConnection(6)
+        with fake_seed(connection):
+            pages = list(paginate.keyset_pages(3))
+        self.assertEqual([len(page) for page in pages], [3, 3])
+
+    def test_prefetch_matches(self):
+        """Prefetching yields the same pages as fetching on demand."""
+        with fake_seed(SQLiteConnection(10)):
+            plain = list(paginate.lazy_paginate(4, prefetch=False))
+        with fake_seed(SQLiteConnection(10)):
+            prefetched = list(paginate.lazy_paginate(4, prefetch=True))
+        self.assertEqual(plain, prefetched)
+
+    def test_no_connection(self):
+        """Without a connection there are no pages."""
+        with fake_seed(None):
+            self.assertEqual(list(paginate.lazy_paginate(3)), [])
+
+
+class TestPrefetched(unittest.TestCase):
+    """Tests for prefetched."""
+
+    def test_error_reaches_consumer(self):
+        """An error in the producer is re-raised to the consumer."""
+        def failing():
+            yield 1
+            raise RuntimeError("page failed")
+
+        pages = paginate.prefetched(failing())
+        self.assertEqual(next(pages), 1)
+        with self.assertRaises(RuntimeError):
+            next(pages)
+
+    def test_close_stops_source(self):
+        """Closing early closes the source iterable too."""
+        closed = []
+
+        def source():
+            try:
+                yield from range(100)
+            finally:
+                closed.append(True)
+
+        pages = paginate.prefetched(source())
+        next(pages)
+        pages.close()
+        self.assertEqual(closed, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
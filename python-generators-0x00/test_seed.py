@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+"""Unit tests for the seed module, without a MySQL server.
+
+insert_data runs against a recording connection. When mysql.connector
+is not installed, seed is imported with a stand-in driver module that
+only provides the Error class these tests raise.
+
+Covers:
+- read_users
+- batched
+- insert_data
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import types
+import unittest
+import uuid
+from unittest.mock import patch
+
+try:
+    import mysql.connector as connector
+except ImportError:
+    class Error(Exception):
+        """The part of mysql.connector.Error that seed relies on."""
+
+        def __init__(self, msg=None, errno=None):
+            super().__init__(msg)
+            self.errno = errno
+
+    connector = types.ModuleType("mysql.connector")
+    connector.Error = Error
+    driver = types.ModuleType("mysql")
+    driver.connector = connector
+    with patch.dict(sys.modules, {"mysql": driver, "mysql.connector": connector}):
+        import seed
+else:
+    import seed
+
+
+class RecordingCursor:
+    """Records statements; LOAD DATA raises ``load_error`` if one is set."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = -1
+
+    def execute(self, query, params=()):
+        if query.startswith("LOAD DATA") and self.connection.load_error is not None:
+            raise self.connection.load_error
+        self.connection.statements.append(query)
+        if query.startswith("LOAD DATA"):
+            self.rowcount = self.connection.load_rows
+
+    def executemany(self, query, rows):
+        self.connection.inserted.extend(rows)
+
+    def close(self):
+        self.connection.cursor_closed = True
+
+
+class RecordingConnection:
+    def __init__(self, load_error=None, load_rows=0):
+        self.load_error = load_error
+        self.load_rows = load_rows
+        self.statements = []
+        self.inserted = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.cursor_closed = False
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def write_csv(test, text):
+    """Write ``text`` to a temporary CSV file removed after ``test``."""
+    handle, path = tempfile.mkstemp(suffix=".csv")
+    with os.fdopen(handle, "w", newline="", encoding="utf-8") as csv_file:
+        csv_file.write(text)
+    test.addCleanup(os.remove, path)
+    return path
+
+
+USERS = "name,email,age\nAda,ada@example.com,36\n\nAlan,alan@example.com,41\nGrace,grace@example.com,85\n"
+
+
+class TestReadUsers(unittest.TestCase):
+    """Tests for read_users and batched."""
+
+    def test_generates_ids(self):
+        """Rows without a user_id get a fresh UUID; blank lines are skipped."""
+        users = list(seed.read_users(write_csv(self, USERS)))
+        self.assertEqual([user[1:] for user in users], [
+            ("Ada", "ada@example.com", "36"),
+            ("Alan", "alan@example.com", "41"),
+            ("Grace", "grace@example.com", "85"),
+        ])
+        for user in users:
+            uuid.UUID(user[0])
+
+    def test_keeps_ids_and_reorders(self):
+        """A user_id column is kept and columns are read by header name."""
+        path = write_csv(self, "age, email, user_id, name\n36,ada@example.com,id-1,Ada\n")
+        self.assertEqual(list(seed.read_users(path)), [("id-1", "Ada", "ada@example.com", "36")])
+
+    def test_batched(self):
+        """Batches hold up to size items, the last one what is left."""
+        self.assertEqual(list(seed.batched(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(seed.batched([], 3)), [])
+
+
+class TestInsertData(unittest.TestCase):
+    """Tests for insert_data."""
+
+    def load(self, connection, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return seed.insert_data(connection, write_csv(self, USERS), **kwargs)
+
+    def test_load_data(self):
+        """LOAD DATA loads the file when the server allows it."""
+        connection = RecordingConnection(load_rows=3)
+        self.assertEqual(self.load(connection), 3)
+        self.assertTrue(any(query.startswith("LOAD DATA") for query in connection.statements))
+        self.assertEqual(connection.inserted, [])
+        self.assertEqual((connection.commits, connection.rollbacks), (1, 0))
+        self.assertTrue(connection.cursor_closed)
+
+    def test_falls_back_when_local_infile_is_off(self):
+        """Each local-infile refusal falls back to batched inserts."""
+        for errno in sorted(seed.LOCAL_INFILE_ERRORS):
+            with self.subTest(errno=errno):
+                connection = RecordingConnection(connector.Error(msg="local infile off", errno=errno))
+                progress = []
+                self.assertEqual(self.load(connection, batch_size=2, progress=progress.append), 3)
+                self.assertEqual([user[1] for user in connection.inserted], ["Ada", "Alan", "Grace"])
+                self.assertEqual(progress, [2, 3])
+                self.assertEqual((connection.commits, connection.rollbacks), (1, 1))
+
+    def test_other_errors_are_raised(self):
+        """Any other LOAD DATA error is raised, with nothing inserted."""
+        for errno in (1064, 1062, 2013):
+            with self.subTest(errno=errno):
+                error = connector.Error(msg="failed", errno=errno)
+                connection = RecordingConnection(error)
+                with self.assertRaises(connector.Error) as raised:
+                    self.load(connection)
+                self.assertIs(raised.exception, error)
+                self.assertEqual(connection.inserted, [])
+                self.assertEqual(connection.commits, 0)
+                self.assertTrue(connection.cursor_closed)
+
+    def test_load_data_method_does_not_fall_back(self):
+        """method="load_data" raises even a local-infile refusal."""
+        connection = RecordingConnection(connector.Error(msg="local infile off", errno=3948))
+        with self.assertRaises(connector.Error):
+            self.load(connection, method="load_data")
+        self.assertEqual(connection.inserted, [])
+
+    def test_insert_method(self):
+        """method="insert" never tries LOAD DATA."""
+        connection = RecordingConnection(load_rows=3)
+        self.assertEqual(self.load(connection, method="insert"), 3)
+        self.assertEqual(connection.statements, [])
+        self.assertEqual(len(connection.inserted), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
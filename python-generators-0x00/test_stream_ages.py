@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""Unit tests for the 4-stream_ages module.
+
+Ages live in an in-memory SQLite user_data table; the seed module is
+replaced by a stand-in that connects to it, so no MySQL server is needed.
+
+Covers:
+- consume
+- sql_aggregates / average_age
+- KLLSketch
+"""
+
+import bisect
+import math
+import random
+import sqlite3
+import sys
+import types
+import unittest
+from unittest.mock import patch
+
+ages = __import__("4-stream_ages")
+batching = __import__("1-batch_processing")
+
+AGES = [18 + (i * 37) % 80 for i in range(2500)]
+
+
+def user_data(values=AGES):
+    """A SQLite connection holding ``values`` as the ages in user_data."""
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE user_data (user_id INTEGER PRIMARY KEY, name TEXT, age INTEGER)")
+    connection.executemany(
+        "INSERT INTO user_data (name, age) VALUES (?, ?)", [(f"user {i}", age) for i, age in enumerate(values)]
+    )
+    return connection
+
+
+def fake_seed(connect):
+    """A seed module whose connect_to_prodev calls ``connect``."""
+    module = types.ModuleType("seed")
+    module.connect_to_prodev = connect
+    return patch.dict(sys.modules, {"seed": module})
+
+
+class TestAverages(unittest.TestCase):
+    """Streamed aggregates agree with the ones pushed down to the database."""
+
+    def test_streaming_matches_pushdown(self):
+        """Both ways of computing the average age give the same answer."""
+        with fake_seed(user_data):
+            streamed = ages.average_age(pushdown=False)
+            pushed = ages.average_age(pushdown=True)
+        self.assertAlmostEqual(streamed, sum(AGES) / len(AGES))
+        self.assertAlmostEqual(streamed, pushed)
+
+    def test_exact_aggregates_match(self):
+        """Rows, pages and column batches all match sql_aggregates."""
+        connection = user_data()
+        expected = ages.sql_aggregates(connection)
+        query = "SELECT user_id, age FROM user_data"
+        sources = {
+            "rows": (ages.stream.stream_rows(connection, query, arraysize=300), "age"),
+            "values": ((age for (age,) in connection.execute("SELECT age FROM user_data")), None),
+            "batches": (batching.stream_column_batches(connection, query, batch_size=300), "age"),
+        }
+        for name, (source, column) in sources.items():
+            with self.subTest(source=name):
+                result = ages.consume(source, column=column).result()
+                self.assertEqual(result["count"], expected["count"])
+                for key in ("sum", "mean", "variance", "min", "max"):
+                    self.assertAlmostEqual(result[key], expected[key], places=6)
+
+    def test_no_users(self):
+        """An empty table averages to NaN either way."""
+        with fake_seed(lambda: user_data([])):
+            self.assertTrue(math.isnan(ages.average_age(pushdown=False)))
+            self.assertTrue(math.isnan(ages.average_age(pushdown=True)))
+
+    def test_no_connection(self):
+        """A failed connection averages to NaN instead of raising."""
+        with fake_seed(lambda: None):
+            self.assertTrue(math.isnan(ages.average_age(pushdown=False)))
+            self.assertTrue(math.isnan(ages.average_age(pushdown=True)))
+
+
+class TestConsume(unittest.TestCase):
+    """Tests for consume."""
+
+    def test_pages(self):
+        """Pages of rows are read at the column."""
+        pages = [[{"age": 20}, {"age": 30}], [{"age": 40}]]
+        self.assertEqual(ages.consume(pages, column="age").stats.mean, 30)
+
+    def test_column_batch_needs_column(self):
+        """A column batch without a column is a ValueError naming the columns."""
+        batch = batching.ColumnBatch.from_rows(("user_id", "age"), [(1, 20)])
+        with self.assertRaisesRegex(ValueError, "user_id, age"):
+            ages.consume([batch])
+
+    def test_rows_need_column(self):
+        """Dict rows without a column are a ValueError too."""
+        with self.assertRaises(ValueError):
+            ages.consume([{"age": 20}])
+
+
+class TestKLLSketch(unittest.TestCase):
+    """Tests for KLLSketch."""
+
+    def rank_errors(self, values, k, seed):
+        sketch = ages.KLLSketch(k=k, seed=seed)
+        sketch.add_many(values[: len(values) // 2])
+        for value in values[len(values) // 2:]:
+            sketch.add(value)
+        ordered = sorted(values)
+        errors = []
+        for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+            rank = bisect.bisect_right(ordered, sketch.quantile(q)) / len(values)
+            errors.append(abs(rank - q))
+        return sketch, errors
+
+    def test_rank_error_within_bound(self):
+        """Quantiles land within the ~1.7/k rank error, with some slack."""
+        rng = random.Random(7)
+        values = [rng.random() for _ in range(100_000)]
+        for k in (100, 200):
+            for seed in range(3):
+                with self.subTest(k=k, seed=seed):
+                    _, errors = self.rank_errors(values, k, seed)
+                    self.assertLessEqual(max(errors), 2.5 / k)
+
+    def test_memory_stays_bounded(self):
+        """The sketch keeps O(k) values, not one per input."""
+        values = [float(i) for i in range(100_000)]
+        sketch, _ = self.rank_errors(values, 200, 0)
+        self.assertLess(sketch.size, 4 * 200)
+
+    def test_empty(self):
+        """An empty sketch has no quantiles."""
+        self.assertTrue(math.isnan(ages.KLLSketch().quantile(0.5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+"""Unit tests for the 0-stream_users module, against in-memory SQLite.
+
+Covers:
+- row_factory_for
+- stream_batches
+- stream_rows
+"""
+
+import sqlite3
+import threading
+import unittest
+
+stream = __import__("0-stream_users")
+
+
+class RecordingConnection:
+    """A SQLite connection that remembers the cursors it hands out."""
+
+    def __init__(self, rows):
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.execute("CREATE TABLE user_data (user_id INTEGER, name TEXT, age INTEGER)")
+        self.connection.executemany(
+            "INSERT INTO user_data VALUES (?, ?, ?)",
+            [(i, f"user {i}", 20 + i % 50) for i in range(rows)],
+        )
+        self.cursors = []
+        self.closed = False
+
+    def cursor(self):
+        cursor = self.connection.cursor()
+        self.cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        self.closed = True
+        self.connection.close()
+
+
+def is_closed(cursor):
+    """True if ``cursor`` was closed."""
+    try:
+        cursor.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+QUERY = "SELECT user_id, name, age FROM user_data ORDER BY user_id"
+
+
+class TestRowFactoryFor(unittest.TestCase):
+    """Tests for row_factory_for."""
+
+    description = (("user_id",), ("name",), ("age",))
+
+    def test_tuple_keeps_rows(self):
+        """Tuples need no conversion."""
+        self.assertIsNone(stream.row_factory_for("tuple", self.description))
+
+    def test_dict_and_namedtuple(self):
+        """Rows map onto the column names."""
+        row = (1, "user 1", 21)
+        self.assertEqual(
+            stream.row_factory_for("dict", self.description)(row),
+            {"user_id": 1, "name": "user 1", "age": 21},
+        )
+        self.assertEqual(stream.row_factory_for("namedtuple", self.description)(row).name, "user 1")
+
+    def test_unknown_kind(self):
+        """An unknown kind is rejected."""
+        with self.assertRaises(ValueError):
+            stream.row_factory_for("list", self.description)
+
+
+class TestStreamBatches(unittest.TestCase):
+    """Tests for stream_batches."""
+
+    def test_batches_of_arraysize(self):
+        """Rows arrive in batches of at most arraysize."""
+        connection = RecordingConnection(25)
+        sizes = [len(rows) for _, rows in stream.stream_batches(connection, QUERY, arraysize=10)]
+        self.assertEqual(sizes, [10, 10, 5])
+        self.assertTrue(is_closed(connection.cursors[0]))
+        self.assertFalse(connection.closed)
+
+    def test_close_connection(self):
+        """The connection is closed with the cursor when asked to."""
+        connection = RecordingConnection(3)
+        list(stream.stream_batches(connection, QUERY, close_connection=True))
+        self.assertTrue(connection.closed)
+
+    def test_cancel(self):
+        """Setting the cancel event ends the stream at the next batch."""
+        connection = RecordingConnection(50)
+        cancel = threading.Event()
+        batches = []
+        for _, rows in stream.stream_batches(connection, QUERY, arraysize=10, cancel=cancel):
+            batches.append(rows)
+            cancel.set()
+        self.assertEqual(len(batches), 1)
+        self.assertTrue(is_closed(connection.cursors[0]))
+
+
+class TestStreamRows(unittest.TestCase):
+    """Tests for stream_rows."""
+
+    def test_all_rows_in_order(self):
+        """Every row comes back once, in query order, across batches."""
+        connection = RecordingConnection(25)
+        rows = list(stream.stream_rows(connection, QUERY, row_factory="tuple", arraysize=7))
+        self.assertEqual([row[0] for row in rows], list(range(25)))
+        self.assertIsInstance(rows[0], tuple)
+
+    def test_dict_rows(self):
+        """Dict rows are keyed by column name."""
+        connection = RecordingConnection(1)
+        self.assertEqual(
+            list(stream.stream_rows(connection, QUERY)),
+            [{"user_id": 0, "name": "user 0", "age": 20}],
+        )
+
+    def test_unknown_row_factory(self):
+        """A bad row_factory fails before any query runs."""
+        connection = RecordingConnection(1)
+        with self.assertRaises(ValueError):
+            next(stream.stream_rows(connection, QUERY, row_factory="list"))
+        self.assertEqual(connection.cursors, [])
+
+    def test_early_stop_closes_cursor(self):
+        """Closing the row stream mid-batch closes the cursor right away."""
+        connection = RecordingConnection(50)
+        rows = stream.stream_rows(connection, QUERY, arraysize=10, close_connection=True)
+        self.assertEqual(next(rows)["user_id"], 0)
+        self.assertFalse(is_closed(connection.cursors[0]))
+        rows.close()
+        self.assertTrue(is_closed(connection.cursors[0]))
+        self.assertTrue(connection.closed)
+
+    def test_consumer_error_closes_cursor(self):
+        """An error in the consumer closes the cursor as the stream unwinds."""
+        connection = RecordingConnection(50)
+        rows = stream.stream_rows(connection, QUERY, arraysize=10)
+        next(rows)
+        with self.assertRaises(RuntimeError):
+            rows.throw(RuntimeError("consumer failed"))
+        self.assertTrue(is_closed(connection.cursors[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()